@@ -7,10 +7,20 @@ import requests
 import logging
 import datetime
 import re
+import threading
 from typing import List, Dict
 
 import eail
 import mem_auditor
+import mem_doctor
+import mem_backup
+import mem_merkle
+import mem_jobs
+from context_packer import ContextPacker, Section, estimate_tokens
+from simhash_index import SimHashIndex
+import mem_rollup
+import content_filter
+from working_set import TurnIndex, DoctrineIndex
 
 # ─────────────────────────────────────────────────────────────
 # Configuration
@@ -22,6 +32,25 @@ OLLAMA_URL = "http://localhost:11434/api/generate"
 # MEMORY SETTINGS
 RECENT_LIMIT = 80       
 DEEP_RECALL_LIMIT = 20  
+TIMELINE_LIMIT = 100
+HISTORY_WINDOW = max(RECENT_LIMIT, TIMELINE_LIMIT)  # Turns kept decoded in RAM
+HISTORY_WINDOW_BYTES = 1024 * 1024                  # ...and at most this much text
+WORKING_SET_BYTES = 64 * 1024 * 1024                # RAM ceiling for turn metadata + decoded window (working_set.py)
+
+# PROMPT BUDGET (approximate tokens for the whole prompt)
+CONTEXT_TOKEN_BUDGET = 6000
+RECENT_TOKEN_SHARE = 0.6    # Immediate context may use at most this much; recall gets the rest
+
+# DEEP RECALL STRATEGY: "keyword" (substring match) or "simhash" (Hamming distance on semhash16)
+RECALL_STRATEGY = "keyword"
+SIMHASH_RADIUS = 14
+
+# LONG-TERM MEMORY (session -> day -> month rollups, see mem_rollup.py)
+ROLLUP_ENABLED = True
+LONG_TERM_TOKEN_SHARE = 0.15
+
+# MAINTENANCE JOBS (mem_jobs.py; schedules are set in app.py)
+JOBS_STATE_SUFFIX = ".jobs.json"
 
 logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
 
@@ -45,57 +74,83 @@ class LocalAgent:
     def __init__(self):
         self.mem_path = MEMORY_FILE
         self.mem = eail.CorthrexMem(self.mem_path)
-        self.mem._rebuild_index()
-        self.history = []
+        # Turn metadata in arrays, text decoded only for the newest turns; the rest is read from the mmap on demand
+        self.turns = TurnIndex(self.mem, window=HISTORY_WINDOW, window_bytes=HISTORY_WINDOW_BYTES, max_bytes=WORKING_SET_BYTES)
+        self.doctrine = DoctrineIndex(self.mem)
         self.system_directives = [] 
-        self._load_memory()
+        self.directive_offsets = []
+        self.packer = ContextPacker()
+        self.sim_index = SimHashIndex(self.mem) if RECALL_STRATEGY == "simhash" else None
+        self._index_lock = threading.Lock()  # sim_index is swapped by the index job
+        self.rollup = mem_rollup.MemRollup(self.mem, summarizer=self._summarize)
+        self._load_memory()  # the rollup thread is started by the serving process (app.py)
 
     def _load_memory(self):
         logging.info("[Corthrex] Loading neural pathways...")
-        self.history.clear()
+        self.turns.reset()
         self.system_directives.clear()
+        self.directive_offsets.clear()
         try:
-            for rec in self.mem.scan():
-                text = eail.extract_text_fast(rec["payload"])
-                if not text or not text.strip(): continue
-                if rec['agent_id'] == 9999 or rec["type"] == eail.RT_SYS_DIAGNOSTIC:
-                    self.system_directives.append(text.strip())
-                elif rec["type"] in (eail.RT_USER_REQUEST, eail.RT_AGENT_RESPONSE):
-                    self.history.append({"type": rec["type"], "text": text.strip()})
+            # Doctrine can live anywhere in the file: its offsets come from a sidecar, only new blocks are scanned
+            self.doctrine.sync()
+            for offset, text in zip(self.doctrine.offsets, self.doctrine.texts()):
+                if text and text.strip():
+                    self.system_directives.append(text.strip()); self.directive_offsets.append(offset)
+
+            # Recent window is seeded from the tail (scan_reverse): O(window), not O(history)
+            self.turns.sync()
         except Exception as e:
             logging.error(f"Memory load error: {e}")
-        logging.info(f"[Corthrex] Loaded {len(self.history)} chats.")
+        logging.info(f"[Corthrex] Loaded {len(self.turns)} recent chats.")
+
+    def reload(self):
+        """After a maintenance job rewrote the file: every offset held in RAM now names another record."""
+        self.packer = ContextPacker()  # token counts are cached per offset
+        self.rollup.reset()  # its catalog and scan position are offsets too; the next pass re-reads the file
+        self._load_memory()
+        if self.sim_index is not None:
+            with self._index_lock: self.sim_index = SimHashIndex(self.mem)  # notices the rewrite and rebuilds
+
+    def rebuild_indexes(self, log=logging.info) -> Dict:
+        """Catches the Merkle sidecar up and, with simhash recall, builds a fresh SimHash index and swaps it in."""
+        merkle = mem_merkle.MerkleLog(self.mem)
+        stats = {'merkle_added': merkle.sync(), 'merkle_leaves': len(merkle)}
+        if self.sim_index is not None:
+            path = self.sim_index.path
+            if os.path.exists(path + '.tmp'): os.remove(path + '.tmp')
+            fresh = SimHashIndex(self.mem, path=path + '.tmp')
+            fresh.sync()
+            with self._index_lock:
+                fresh.sync()  # records appended during the build
+                os.replace(fresh.path, path); fresh.path = path
+                fresh.save()  # replaces the snapshot of the old index
+                self.sim_index = fresh
+            stats['simhash_entries'] = len(fresh)
+        log(f"[INDEX] Merkle: {stats['merkle_leaves']} leaves (+{stats['merkle_added']})"
+            + (f", SimHash: {stats['simhash_entries']} entries" if 'simhash_entries' in stats else ""))
+        return stats
 
     def _write_to_memory(self, agent_id: int, rtype: int, data: bytes):
         # ─────────────────────────────────────────────────────────────
         # POISON PREVENTION PROTOCOL
         # Stop "I'm sorry" or "I cannot" responses from corrupting memory.
         # ─────────────────────────────────────────────────────────────
+        text = eail.extract_text_fast(data)  # decoded once: poison check, SimHash and the text window share it
         if rtype == eail.RT_AGENT_RESPONSE:
             try:
-                text_preview = eail.extract_text_fast(data).lower()
-                # Triggers that indicate the model has defaulted to safety refusal
-                poison_triggers = [
-                    "i cannot access", 
-                    "privacy policy", 
-                    "i am sorry", 
-                    "i'm sorry", 
-                    "personal data",
-                    "as an ai",
-                    "i cannot browse"
-                ]
-                if any(trigger in text_preview for trigger in poison_triggers):
-                    logging.warning(f"[Corthrex] Refusal detected ('{text_preview[:30]}...'). BLOCKING write to memory to prevent poisoning.")
+                # Triggers that indicate the model has defaulted to safety refusal (content_filter.RULE_SETS)
+                trigger = content_filter.get_filter('refusal').search(text)
+                if trigger:
+                    logging.warning(f"[Corthrex] Refusal detected ('{trigger}'). BLOCKING write to memory to prevent poisoning.")
                     return  # <--- STOP. Do not write this failure to memory.
             except Exception as e:
                 logging.error(f"Poison check failed: {e}")
 
         # If clean, write to memory file
-        self.mem.append_with_continuation(agent_id, rtype, data)
+        offsets = self.mem.append_with_continuation(agent_id, rtype, data, text=text)
         if rtype in (eail.RT_USER_REQUEST, eail.RT_AGENT_RESPONSE):
-            text = eail.extract_text_fast(data)
-            if text and text.strip():
-                self.history.append({"type": rtype, "text": text.strip()})
+            self.turns.sync()
+            self.turns.remember(offsets[0], text)
 
     def get_stats(self) -> dict:
         try:
@@ -113,69 +168,108 @@ class LocalAgent:
             requests.get("http://127.0.0.1:11434", timeout=0.5)
             ollama_online = True
         except: pass
-        return {"size": size_str, "blocks": blocks, "status": status, "ollama_online": ollama_online}
+        return {"size": size_str, "blocks": blocks, "status": status, "ollama_online": ollama_online,
+                "cache": self.mem.cache.stats(), "working_set": self.turns.memory_report()}
+
+    def _iter_older_turns(self):
+        """Walks the turn index backward past the immediate-context window, newest first."""
+        return self.turns.newest(skip=RECENT_LIMIT)
 
-    def _retrieve_context(self, user_input: str) -> str:
+    def _iter_similar_turns(self, user_input: str):
+        """Deep recall by SimHash distance to the message, closest first, outside the immediate-context window."""
+        if len(self.turns) < RECENT_LIMIT: return  # everything is already in the immediate context
+        window_start = self.turns.offset(-RECENT_LIMIT)
+        with self._index_lock:
+            self.sim_index.sync()
+            hits = self.sim_index.similar(user_input, k=SIMHASH_RADIUS)
+        for offset, _ in hits:
+            if offset >= window_start: continue
+            rec = self.mem.get_record_at(offset)
+            if rec is None or rec['agent_id'] == 9999 or rec['type'] not in (eail.RT_USER_REQUEST, eail.RT_AGENT_RESPONSE): continue
+            text = self.mem.get_text(offset)
+            if text and text.strip(): yield {"type": rec['type'], "text": text.strip(), "offset": offset}
+
+    def _retrieve_context(self, user_input: str) -> List[Section]:
+        """Prompt sections for this turn. Fill priority: recent turns, then rollups, then recall."""
         input_lower = user_input.lower()
-        context_str = ""
+        self.turns.sync()  # turns another writer appended
+        role = lambda r: "User" if r["type"] == eail.RT_USER_REQUEST else "Corthrex"
+        sections = []
+
+        # 0. LONG-TERM MEMORY (coarsest rollup per stretch of history, newest first)
+        rollups = [(s['offset'], "- ", s['text']) for s in self.rollup.context_entries()]
+        if rollups:
+            sections.append(Section("--- LONG-TERM MEMORY ---", rollups, priority=2, footer="\n",
+                                    max_tokens=int(CONTEXT_TOKEN_BUDGET * LONG_TERM_TOKEN_SHARE)))
 
         # 1. META-RECALL
         meta_triggers = ["discuss", "summarize", "recap", "history", "what did i ask"]
         if any(t in input_lower for t in meta_triggers):
-            context_str += "--- FULL CONVERSATION TIMELINE ---\n"
-            for i, rec in enumerate(self.history[-100:]): 
-                if rec['type'] == eail.RT_USER_REQUEST:
-                    preview = (rec['text'][:150] + '..') if len(rec['text']) > 150 else rec['text']
-                    context_str += f"- {preview}\n"
-            context_str += "\n"
+            timeline = [(("preview", r['offset']), "- ", (r['text'][:150] + '..') if len(r['text']) > 150 else r['text'])
+                        for r in self.turns.newest(TIMELINE_LIMIT) if r['type'] == eail.RT_USER_REQUEST]
+            sections.append(Section("--- FULL CONVERSATION TIMELINE ---", timeline, priority=3, footer="\n"))
 
         # 2. DEEP RECALL
+        elif RECALL_STRATEGY == "simhash":
+            def similar_hits():
+                for found, rec in enumerate(self._iter_similar_turns(user_input)):
+                    if found >= DEEP_RECALL_LIMIT: return
+                    yield rec['offset'], f"[{role(rec)}]: ", rec['text']
+            sections.append(Section("--- RELEVANT PAST MEMORY ---", similar_hits(), priority=3, footer="\n"))
         else:
             keywords = [w.lower() for w in re.findall(r'\w+', user_input) if len(w) > 3]
             if keywords:
-                searchable = self.history[:-RECENT_LIMIT]
-                deep_hits = []
-                for rec in reversed(searchable):
-                    if any(kw in rec['text'].lower() for kw in keywords):
-                        deep_hits.append(rec)
-                        if len(deep_hits) >= DEEP_RECALL_LIMIT: break
-                
-                if deep_hits:
-                    context_str += "--- RELEVANT PAST MEMORY ---\n"
-                    for r in reversed(deep_hits):
-                        role = "User" if r["type"] == eail.RT_USER_REQUEST else "Corthrex"
-                        context_str += f"[{role}]: {r['text']}\n"
-                    context_str += "\n"
+                def deep_hits():
+                    found = 0
+                    for rec in self._iter_older_turns():
+                        if any(kw in rec['text'].lower() for kw in keywords):
+                            yield rec['offset'], f"[{role(rec)}]: ", rec['text']
+                            found += 1
+                            if found >= DEEP_RECALL_LIMIT: return
+                sections.append(Section("--- RELEVANT PAST MEMORY ---", deep_hits(), priority=3, footer="\n"))
 
         # 3. IMMEDIATE CONTEXT
-        context_str += f"--- IMMEDIATE CONTEXT (LAST {RECENT_LIMIT}) ---\n"
-        recent = self.history[-RECENT_LIMIT:]
-        for r in recent:
-            role = "User" if r["type"] == eail.RT_USER_REQUEST else "Corthrex"
-            context_str += f"{role}: {r['text']}\n"
-            
-        return context_str
+        recent = [(r['offset'], f"{role(r)}: ", r['text']) for r in self.turns.newest(RECENT_LIMIT)]
+        sections.append(Section(f"--- IMMEDIATE CONTEXT (LAST {RECENT_LIMIT}) ---", recent, priority=1,
+                                max_tokens=int(CONTEXT_TOKEN_BUDGET * RECENT_TOKEN_SHARE)))
+        return sections
 
     def _build_prompt(self, user_input: str) -> str:
         # 1. SYSTEM PROMPT FIRST
         prompt = get_system_prompt() + "\n\n"
         
-        # 2. Optional injected system doctrine (genesis identity, etc.)
-        if self.system_directives:
-            prompt += "--- SYSTEM DOCTRINE ---\n" + "\n\n".join(self.system_directives) + "\n\n"
-        
-        # 3. Retrieved memory context (recent + deep recall)
-        prompt += self._retrieve_context(user_input)
-        
         # 4. THE PINCER MOVE (Recency Anchor)
         # Force the Full Date and Time right before the user speaks.
         current_time_full = datetime.datetime.now().strftime("%A, %B %d, %Y at %I:%M %p")
         live_anchor = f"\n[Context: It is currently {current_time_full}.]\n"
 
         # 5. Final user turn
-        prompt += f"{live_anchor}\nUser: {user_input}\nCorthrex:"
+        closing = f"{live_anchor}\nUser: {user_input}\nCorthrex:"
+
+        # 2. Optional injected system doctrine (genesis identity, etc.)
+        # 3. Retrieved memory context, packed by priority into what the fixed parts leave over
+        sections = []
+        if self.system_directives:
+            doctrine = [(off, "", text) for off, text in zip(self.directive_offsets, self.system_directives)]
+            sections.append(Section("--- SYSTEM DOCTRINE ---", doctrine, priority=0, newest_first=False, separator="\n\n", footer="\n"))
+        sections += self._retrieve_context(user_input)
+        budget = CONTEXT_TOKEN_BUDGET - estimate_tokens(prompt) - estimate_tokens(closing)
+        prompt += self.packer.pack(sections, budget)
         
-        return prompt
+        return prompt + closing
+
+    def _summarize(self, texts: List[str], level: int) -> str:
+        """Rollup summarizer: asks the local model, falls back to extractive when Ollama is down."""
+        prompt = (f"Condense this {mem_rollup.LEVEL_NAMES.get(level, 'memory')} log into a short factual summary "
+                  "(at most 120 words). Keep names, decisions, facts and open questions. No preamble.\n\n" + "\n".join(texts))
+        try:
+            resp = requests.post(OLLAMA_URL, json={"model": DEFAULT_MODEL, "prompt": prompt, "stream": False}, timeout=120)
+            if resp.status_code == 200:
+                summary = resp.json().get("response", "").strip()
+                if summary: return summary
+        except Exception as e:
+            logging.warning(f"[Rollup] LLM summary unavailable ({e}); using extractive fallback.")
+        return mem_rollup.extractive_summary(texts, level)
 
     def generate_response(self, user_input: str, model: str = None) -> str:
         model = model or DEFAULT_MODEL
@@ -206,12 +300,60 @@ class LocalAgent:
 class AgentManager:
     def __init__(self):
         self.local = LocalAgent()
-        self.help_text = "**CORTHREX COMMANDS**\n`helpme`\n`integrity check`\n`status`"
+        self.jobs = mem_jobs.JobScheduler(state_path=MEMORY_FILE + JOBS_STATE_SUFFIX)
+        self._register_jobs()
+        self.help_text = "**CORTHREX COMMANDS**\n`helpme`\n`integrity check`\n`jobs`\n`job <id>`\n`status`"
+
+    def _register_jobs(self):
+        # Maintenance on the live file: rewrites take the agent's write_lock only for the final swap
+        agent = self.local
+        def audit(job, full=False):
+            auditor = mem_auditor.MemAuditor(agent.mem_path, write_lock=agent.mem.write_lock)
+            report = auditor.audit_and_repair(full=full)
+            if auditor.rewrote: agent.reload()
+            return {"report": report, "rewrote": auditor.rewrote, "tampered": auditor.tampered}
+        def doctor(job):
+            report = mem_doctor.MemDoctor(agent.mem_path, write_lock=agent.mem.write_lock).start_cleaning_cycle()
+            if report and report['rewritten']: agent.reload()
+            return report
+        def backup(job):
+            return mem_backup.IncrementalBackup(agent.mem_path).sync(log=job.log)
+        def index(job):
+            return agent.rebuild_indexes(log=job.log)
+        # Parameters are reachable over HTTP (/api/jobs): only what is safe for any caller to set
+        for kind, fn, params in (("audit", audit, {'full': bool}), ("doctor", doctor, None),
+                                 ("backup", backup, None), ("index", index, None)):
+            self.jobs.register(kind, fn, params)
+
+    def _jobs_text(self) -> str:
+        lines = ["**MAINTENANCE JOBS**"]
+        for job in self.jobs.list()[:10]:
+            line = f"- #{job['id']} `{job['kind']}` {job['status']}"
+            if job['status'] == 'running': line += f" ({job['progress'] * 100:.0f}%)"
+            if job['error']: line += f": {job['error']}"
+            lines.append(line)
+        for kind, s in self.jobs.schedule().items():
+            lines.append(f"- `{kind}` every {s['every'] / 3600:g} h, next {datetime.datetime.fromtimestamp(s['next_run']):%Y-%m-%d %H:%M}")
+        return "\n".join(lines) if len(lines) > 1 else "No maintenance jobs yet."
+
+    def _job_text(self, job_id: int) -> str:
+        job = self.jobs.get(job_id)
+        if job is None: return f"No job #{job_id}."
+        if not job.done: return f"Job #{job.id} `{job.kind}` is {job.status} ({job.progress * 100:.0f}%). {job.message}"
+        if job.status != 'done': return f"Job #{job.id} `{job.kind}` {job.status}. {job.error or ''}"
+        if isinstance(job.result, dict) and 'report' in job.result: return job.result['report']
+        return f"**JOB #{job.id} `{job.kind}`**\n" + "\n".join(f"- {k}: {v}" for k, v in (job.result or {}).items())
 
     def process(self, user_input: str, model: str = None) -> str:
         lower = user_input.strip().lower()
         if lower in {"help", "helpme", "commands"}: return self.help_text
-        if "integrity" in lower: return mem_auditor.run_audit_return_text()
+        if "integrity" in lower:
+            # Runs on the maintenance worker, never inside the chat request
+            job = self.jobs.submit("audit")
+            return f"Integrity audit queued as job #{job.id}. Type `job {job.id}` for the report."
+        if lower in {"jobs", "job status"}: return self._jobs_text()
+        match = re.fullmatch(r"job #?(\d+)", lower)
+        if match: return self._job_text(int(match.group(1)))
         if any(x in lower for x in {"status", "memory", "file"}):
             stats = self.local.get_stats()
             return f"**MEMORY STATUS**\n- File: `{MEMORY_FILE}`\n- Size: {stats['size']}\n- Records: {stats['blocks']}"
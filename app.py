@@ -1,6 +1,7 @@
+import os
 from flask import Flask, render_template, request, jsonify
 import requests
-from ai_logic import AgentManager
+from ai_logic import AgentManager, ROLLUP_ENABLED
 import benchmark_corthrex  # <--- CRITICAL IMPORT
 
 # CONFIGURATION
@@ -9,6 +10,17 @@ app = Flask(__name__, template_folder='.', static_folder='.', static_url_path=''
 # Initialize the Corthrex Logic Core
 manager = AgentManager()
 OLLAMA_HOST = "http://localhost:11434"
+DEBUG = True
+
+# MAINTENANCE SCHEDULE: job kind -> seconds between runs (mem_jobs.py)
+JOB_SCHEDULE = {
+    "backup": 6 * 3600,
+    "audit": 24 * 3600,
+    "index": 24 * 3600,
+}
+
+# Benchmarks go through the job worker too: 5,000 fsynced writes never run inside a request
+manager.jobs.register('benchmark', lambda job: benchmark_corthrex.run_benchmark_return_stats())
 
 @app.route('/')
 def home():
@@ -28,11 +40,13 @@ def chat():
     messages = data.get('messages', [])
     user_input = messages[-1].get('content', '') if messages else ""
     model = data.get('model', 'llama3')
-    
+
     if not user_input: return jsonify({"error": "No input provided"}), 400
 
-    response_text = manager.process(user_input, model)
-    
+    # Background jobs pause while a chat turn is in flight
+    with manager.jobs.foreground():
+        response_text = manager.process(user_input, model)
+
     return jsonify({
         "message": { "content": response_text, "role": "assistant" },
         "done": True
@@ -42,11 +56,37 @@ def chat():
 def stats():
     return jsonify(manager.get_dashboard_stats())
 
-# --- THIS IS THE MISSING ROUTE ---
 @app.route('/api/benchmark', methods=['POST'])
 def run_benchmark():
-    stats = benchmark_corthrex.run_benchmark_return_stats()
-    return jsonify(stats)
+    job = manager.jobs.submit('benchmark')
+    return jsonify(job.to_dict()), 202
+
+# --- Maintenance jobs ---
+@app.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    return jsonify({"jobs": manager.jobs.list(), "kinds": manager.jobs.kinds, "schedule": manager.jobs.schedule()})
+
+@app.route('/api/jobs', methods=['POST'])
+def submit_job():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict): return jsonify({"error": "expected a JSON object"}), 400
+    try:
+        job = manager.jobs.submit(str(data.get('kind', '')), data.get('params'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(job.to_dict()), 202
+
+@app.route('/api/jobs/<int:job_id>', methods=['GET'])
+def get_job(job_id):
+    job = manager.jobs.get(job_id)
+    if job is None: return jsonify({"error": f"no job {job_id}"}), 404
+    return jsonify(job.to_dict(log=True))
+
+@app.route('/api/jobs/<int:job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    job = manager.jobs.cancel(job_id)
+    if job is None: return jsonify({"error": f"no job {job_id}"}), 404
+    return jsonify(job.to_dict())
 
 if __name__ == '__main__':
     print("---------------------------------------")
@@ -54,4 +94,9 @@ if __name__ == '__main__':
     print("---------------------------------------")
     print(" * Interface: http://localhost:5000")
     print(" * Memory:    corthrex.cxm")
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    # The debug reloader runs this file in a watcher process as well; only the serving process schedules
+    # jobs and rolls up memory (both append to the file)
+    if not DEBUG or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        for kind, seconds in JOB_SCHEDULE.items(): manager.jobs.every(kind, seconds)
+        if ROLLUP_ENABLED: manager.local.rollup.start()
+    app.run(host='0.0.0.0', port=5000, debug=DEBUG)
@@ -0,0 +1,140 @@
+# content_filter.py
+# Corthrex Content Filter
+# One compiled matcher for every "this text must not be remembered" rule,
+# shared by the write path (ai_logic) and the bulk cleaner (mem_doctor).
+#
+# Rules are plain case-insensitive substrings grouped into named sets. All
+# patterns of the chosen sets are merged into a trie and emitted as a single
+# regex with shared prefixes factored out ("i cannot access|i cannot browse"
+# becomes "i\ cannot\ (?:access|browse)"), so a text is scanned once no
+# matter how many rules there are. A pattern that extends another one can
+# never change a yes/no answer and is pruned from the automaton. Texts are
+# lowercased once up front: re.IGNORECASE defeats sre's first-character
+# scan and costs ~4x.
+#
+# Extra rules can be dropped into content_rules.json next to this module (the
+# app directory, whatever the working directory is):
+#   {"refusal": ["i'm unable to"], "garbage": ["lorem ipsum"]}
+
+import os
+import re
+import json
+import bisect
+import logging
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+# --- Configuration ---
+RULES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "content_rules.json")
+BATCH_CHARS = 1 << 20         # texts joined per regex pass in batch mode
+_SEP = '\x00'                 # batch separator; patterns never contain it
+
+RULE_SETS: Dict[str, Tuple[str, ...]] = {
+    # The model fell back to a safety refusal: never written to memory
+    'refusal': (
+        "i cannot access", "privacy policy", "i am sorry", "i'm sorry",
+        "personal data", "as an ai", "i cannot browse",
+    ),
+    # Boilerplate the cleaner removes from existing files
+    'garbage': (
+        "as an ai language model", "i cannot browse", "i do not have access",
+        "cutoff of 2023", "openai", "cannot fulfill", "sorry, i cannot",
+    ),
+}
+
+def load_rules(path: str = RULES_FILE) -> Dict[str, Tuple[str, ...]]:
+    """Built-in RULE_SETS merged with the sets from `path`, if it exists."""
+    rules = {name: tuple(patterns) for name, patterns in RULE_SETS.items()}
+    if path and os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f: extra = json.load(f)
+            for name, patterns in extra.items():
+                rules[name] = rules.get(name, ()) + tuple(str(p) for p in patterns)
+        except (OSError, ValueError, AttributeError) as e:
+            logging.error(f"[Filter] Ignoring {path}: {e}")
+    return rules
+
+def _trie_pattern(words: Iterable[str]) -> str:
+    trie: Dict = {}
+    for word in words:
+        node = trie
+        for ch in word: node = node.setdefault(ch, {})
+        node.clear(); node[''] = True  # anything longer is implied by this word
+    def emit(node: Dict) -> Optional[str]:
+        if '' in node: return None
+        singles, branches = [], []
+        for ch in sorted(node):
+            tail = emit(node[ch])
+            if tail is None: singles.append(re.escape(ch))
+            else: branches.append(re.escape(ch) + tail)
+        if singles: branches.append(singles[0] if len(singles) == 1 else '[' + ''.join(singles) + ']')
+        return branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+    return emit(trie) if trie else ''
+
+class ContentFilter:
+    """
+    Matcher over one or more rule sets. search() screens a single text,
+    scan() screens many at once; both report the first rule that matched.
+    """
+    def __init__(self, sets: Sequence[str] = ('refusal',), rules: Optional[Dict[str, Iterable[str]]] = None):
+        rules = load_rules() if rules is None else rules
+        unknown = [name for name in sets if name not in rules]
+        if unknown: raise ValueError(f"unknown rule sets {unknown}, have {sorted(rules)}")
+        self.sets = tuple(sets)
+        self._owners: Dict[str, Set[str]] = {}  # pattern -> rule sets it belongs to
+        for name in self.sets:
+            for pattern in rules[name]:
+                pattern = pattern.strip().lower()
+                if pattern and _SEP not in pattern: self._owners.setdefault(pattern, set()).add(name)
+        source = _trie_pattern(self._owners)
+        self._regex = re.compile(source) if source else None
+
+    def __len__(self): return len(self._owners)
+
+    def search(self, text: str) -> Optional[str]:
+        """The matched rule (lowercased), or None if the text is clean."""
+        if not text or self._regex is None: return None
+        m = self._regex.search(text.lower())
+        return m.group() if m else None
+
+    def rule_sets(self, rule: Optional[str]) -> Set[str]:
+        """Which of this filter's sets a rule returned by search()/scan() came from."""
+        return set(self._owners.get(rule, ())) if rule else set()
+
+    def scan(self, texts: Iterable[str]) -> List[Optional[str]]:
+        """
+        search() for many texts: texts are joined into ~BATCH_CHARS strings
+        and each batch is one regex pass, jumping to the next text after a hit.
+        """
+        texts = [t.lower() if t else '' for t in texts]  # lower() may change lengths: offsets come from these
+        result: List[Optional[str]] = [None] * len(texts)
+        if self._regex is None: return result
+        i = 0
+        while i < len(texts):
+            j, size = i, 0
+            while j < len(texts) and (j == i or size + len(texts[j]) <= BATCH_CHARS):
+                size += len(texts[j]) + 1; j += 1
+            self._scan_batch(texts, i, j, result)
+            i = j
+        return result
+
+    def _scan_batch(self, texts: List[str], lo: int, hi: int, result: List[Optional[str]]):
+        starts, pos = [], 0
+        for t in texts[lo:hi]: starts.append(pos); pos += len(t) + 1
+        blob = _SEP.join(texts[lo:hi])
+        search, at = self._regex.search, 0
+        while True:
+            m = search(blob, at)
+            if m is None: return
+            k = bisect.bisect_right(starts, m.start()) - 1
+            result[lo + k] = m.group()
+            if k + 1 >= len(starts): return
+            at = starts[k + 1]
+
+_filters: Dict[Tuple[str, ...], ContentFilter] = {}
+
+def get_filter(*sets: str) -> ContentFilter:
+    """Shared, compiled-once filter for the given rule sets."""
+    key = sets or ('refusal',)
+    f = _filters.get(key)
+    if f is None: f = _filters[key] = ContentFilter(key)
+    return f
@@ -0,0 +1,113 @@
+# context_packer.py
+# Corthrex Context Packer
+# Fills a fixed token budget with prompt sections in priority order.
+
+import re
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+# --- Configuration ---
+LINE_OVERHEAD = 3          # role prefix + newline, roughly
+MIN_PARTIAL_TOKENS = 24    # below this a truncated turn is not worth including
+TOKEN_CACHE_LIMIT = 200_000
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+def estimate_tokens(text: str) -> int:
+    """
+    Tokenizer approximation: BPE vocabularies land near one token per word or
+    punctuation mark for prose and near 4 characters per token for everything
+    else, so take whichever is larger.
+    """
+    if not text: return 0
+    return max(len(_TOKEN_RE.findall(text)), (len(text) + 3) // 4)
+
+def truncate_to_tokens(text: str, tokens: int) -> str:
+    limit = max(0, tokens) * 4
+    if len(text) <= limit: return text
+    return text[:limit].rstrip() + " …[truncated]"
+
+class TokenCounter:
+    """
+    Token estimates cached per record offset. Records are immutable once
+    written, so an entry never goes stale; the oldest entries are dropped
+    once the cache is full.
+    """
+    def __init__(self, max_entries: int = TOKEN_CACHE_LIMIT):
+        self.max_entries = max_entries
+        self._counts: Dict[Hashable, int] = {}
+
+    def count(self, key: Optional[Hashable], text: str) -> int:
+        if key is None: return estimate_tokens(text)
+        n = self._counts.get(key)
+        if n is None:
+            n = estimate_tokens(text)
+            if len(self._counts) >= self.max_entries:
+                del self._counts[next(iter(self._counts))]
+            self._counts[key] = n
+        return n
+
+    def __len__(self): return len(self._counts)
+
+class Section:
+    """
+    One block of the prompt. `items` yields (cache_key, prefix, text) triples in
+    the order they should be kept (newest first for conversation turns); the
+    cache key is normally the record offset. The iterable is consumed
+    lazily, so a generator over the memory file is read only as far as needed.
+    Sections are filled in ascending `priority` but rendered in list order.
+    """
+    __slots__ = ('title', 'items', 'priority', 'max_tokens', 'newest_first', 'separator', 'footer')
+
+    def __init__(self, title: str, items: Iterable[Tuple[Optional[Hashable], str, str]],
+                 priority: int = 0, max_tokens: Optional[int] = None, newest_first: bool = True,
+                 separator: str = "\n", footer: str = ""):
+        self.title = title
+        self.items = items
+        self.priority = priority
+        self.max_tokens = max_tokens
+        self.newest_first = newest_first
+        self.separator = separator
+        self.footer = footer
+
+class ContextPacker:
+    def __init__(self, counter: Optional[TokenCounter] = None):
+        self.counter = counter or TokenCounter()
+
+    def _fill(self, sec: Section, cap: int) -> Tuple[List[str], int, Optional[int]]:
+        """Returns (rendered lines in keep order, tokens used, elided count or None if unknown)."""
+        used = estimate_tokens(sec.title) + LINE_OVERHEAD
+        if used >= cap: return [], 0, None
+        lines, taken = [], 0
+        for key, prefix, text in sec.items:
+            n = self.counter.count(key, text) + LINE_OVERHEAD
+            if used + n <= cap:
+                lines.append(prefix + text); used += n; taken += 1
+                continue
+            room = cap - used - LINE_OVERHEAD
+            if room >= MIN_PARTIAL_TOKENS:
+                lines.append(prefix + truncate_to_tokens(text, room)); used = cap; taken += 1
+            total = len(sec.items) if hasattr(sec.items, '__len__') else None
+            return lines, used, (total - taken if total is not None else None)
+        return lines, (used if lines else 0), 0
+
+    def pack(self, sections: List[Section], budget: int) -> str:
+        remaining = budget
+        filled = {}
+        for sec in sorted(sections, key=lambda s: s.priority):
+            cap = remaining if sec.max_tokens is None else min(remaining, sec.max_tokens)
+            lines, used, elided = self._fill(sec, cap)
+            filled[id(sec)] = (lines, elided)
+            remaining -= used
+
+        out = []
+        for sec in sections:
+            lines, elided = filled[id(sec)]
+            if not lines: continue
+            if sec.newest_first: lines = lines[::-1]
+            marker = ""
+            if elided != 0:
+                count = f"{elided} " if elided else ""
+                marker = f"[... {count}{'older ' if sec.newest_first else ''}entries elided to fit the context budget ...]\n"
+            body = sec.separator.join(lines) + "\n"
+            out.append(f"{sec.title}\n" + (marker + body if sec.newest_first else body + marker) + sec.footer)
+        return "".join(out)
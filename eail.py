@@ -1,13 +1,19 @@
 # eail.py
 # Corthrex Extended AI Log Protocol
-# Version: 2.4.1
+# Version: 2.5.0
 
 import os
+import re
+import copy
 import struct
 import time
 import mmap
 import secrets
+import hashlib
 import logging
+import functools
+import threading
+from collections import Counter, OrderedDict
 from typing import Generator, Dict, Any, List, Optional, Tuple
 
 # Setup library logging (silenced by default)
@@ -19,209 +25,901 @@ logger.addHandler(logging.NullHandler())
 # ---------------------------
 FILE_TAG = b'CRTX'
 HEADER_SIZE = 64
-BLOCK_SIZE = 256
+BLOCK_SIZE = 256                 # default for new files; an existing file uses the size in its header
+BLOCK_SIZES = (256, 512, 4096)   # 4096 matches device pages for large-record workloads
+RECORD_OVERHEAD = 42             # 38-byte record header + 4-byte CRC
 RT_USER_REQUEST    = 1; RT_AGENT_RESPONSE  = 2; RT_INTERNAL_DEBATE = 3
 RT_SYS_DIAGNOSTIC  = 4; RT_FACT_CORRECTION = 5; RT_CONTINUATION    = 6; RT_BLOB_REF = 7
-OP_REQ = 0x06; OP_RESP = 0x07; OP_END = 0x09; OP_PUSH_KEY = 0x02
-OP_PUSH_VAL = 0x03; OP_BIND = 0x04; OP_ASSERT = 0x05
-AT_INT = 0x00; AT_BYTES = 0x04; AT_DICTID = 0x05; AT_TEXTID = 0x07
+RT_SUMMARY         = 8  # Rollup of a closed range of turns; link = first source offset
+RT_EVENT           = 9  # External event (sensor reading, ledger line, log entry) from bulk ingestion
+TS_ORDER_SLACK_NS  = 5 * 60 * 10**9  # clock steps tolerated when a query seeks by timestamp
+PAYLOAD_CACHE_BYTES = 8 * 1024 * 1024  # per CorthrexMem; 0 disables the cache
+TEXT_BATCH = 256                 # records a text-selecting query decodes per extract_texts call
+
+# Bytecode lives in eail_codec; re-exported so eail.* stays the one import
+from eail_codec import (
+    OP_REQ, OP_RESP, OP_END, OP_PUSH_KEY, OP_PUSH_VAL, OP_BIND, OP_ASSERT,
+    AT_INT, AT_BYTES, AT_DICTID, AT_TEXTID, EAILDecodeError,
+    op_req, op_resp, op_end, op_bind, op_assert, op_push_key, op_push_val, ops, extract_texts,
+)
+from eail_codec import sleb128_encode as leb128_encode_fast, encode_atom as encode_atom_fast, extract_text as extract_text_fast
 
 _CRC32C_TABLE = tuple(
     (c := i, [c := (c >> 1) ^ 0x1EDC6F41 if c & 1 else c >> 1 for _ in range(8)], c & 0xFFFFFFFF)[2]
     for i in range(256)
 )
 
+# Four bytes per step: after XOR-ing in a little-endian word, the next CRC is
+# LO[low 16 bits] ^ HI[high 16 bits] (slicing-by-4 tables folded pairwise),
+# ~3x fewer interpreter steps than the byte loop. ~5 MB of tables.
+_T1 = tuple(_CRC32C_TABLE[c & 0xFF] ^ (c >> 8) for c in _CRC32C_TABLE)
+_T2 = tuple(_CRC32C_TABLE[c & 0xFF] ^ (c >> 8) for c in _T1)
+_T3 = tuple(_CRC32C_TABLE[c & 0xFF] ^ (c >> 8) for c in _T2)
+_CRC32C_LO = [_T3[lo] ^ _T2[hi] for hi in range(256) for lo in range(256)]
+_CRC32C_HI = [_T1[lo] ^ _CRC32C_TABLE[hi] for hi in range(256) for lo in range(256)]
+del _T1, _T2, _T3
+_WORDS = struct.Struct('<I').iter_unpack
+
+# Zero padding fills most of a large block. Feeding zero bytes is linear in the
+# CRC register, so a run of n zeros is applied as one precomputed operator per
+# set bit of n (four byte-table lookups each) instead of n/4 word steps.
+def _zero_operators(levels: int = 17):
+    images = [_CRC32C_TABLE[1 << i] if i < 8 else _CRC32C_TABLE[0] ^ (1 << i >> 8) for i in range(32)]  # one zero byte
+    apply = lambda imgs, r: functools.reduce(lambda acc, i: acc ^ imgs[i] if r >> i & 1 else acc, range(32), 0)
+    ops = []
+    for _ in range(levels):
+        ops.append(tuple(tuple(functools.reduce(lambda acc, i: acc ^ images[8 * j + i] if b >> i & 1 else acc, range(8), 0)
+                               for b in range(256)) for j in range(4)))
+        images = [apply(images, img) for img in images]  # square: 2x as many zeros
+    return tuple(ops)
+_CRC32C_ZEROS = _zero_operators()
+ZERO_RUN_MIN = 64  # shorter zero tails go through the word loop
+
+def _crc32c_zeros(crc: int, n: int) -> int:
+    for t0, t1, t2, t3 in _CRC32C_ZEROS:
+        if n & 1: crc = t0[crc & 0xFF] ^ t1[crc >> 8 & 0xFF] ^ t2[crc >> 16 & 0xFF] ^ t3[crc >> 24]
+        n >>= 1
+        if not n: break
+    return crc
+
 def crc32c(data: bytes, crc: int = 0) -> int:
     crc ^= 0xFFFFFFFF
-    for b in data: crc = _CRC32C_TABLE[(crc ^ b) & 0xFF] ^ (crc >> 8)
-    return (crc ^ 0xFFFFFFFF) & 0xFFFFFFFF
+    if type(data) is not bytes: data = bytes(data)
+    body = data.rstrip(b'\x00')
+    zeros = len(data) - len(body)
+    if ZERO_RUN_MIN <= zeros < 1 << len(_CRC32C_ZEROS): data = body
+    else: zeros = 0
+    n = len(data) & ~3
+    if n:
+        lo, hi = _CRC32C_LO, _CRC32C_HI
+        for (w,) in _WORDS(data if n == len(data) else data[:n]):
+            c = crc ^ w; crc = lo[c & 0xFFFF] ^ hi[c >> 16]
+    for b in data[n:]: crc = _CRC32C_TABLE[(crc ^ b) & 0xFF] ^ (crc >> 8)
+    if zeros: crc = _crc32c_zeros(crc, zeros)
+    return crc ^ 0xFFFFFFFF
+
+# SimHash: each distinct word votes on all 128 bits with weight = its count.
+# Bits are spread into 32-bit lanes of one big int, so a word's vote is one
+# big-int multiply-add, and the majority test runs on all lanes at once.
+_WORD_RE = re.compile(r'\w+')
+_LANE_BYTES = tuple(b''.join(((b >> i) & 1).to_bytes(4, 'little') for i in range(8)) for b in range(256))
+_LANE_ONES = int.from_bytes(b'\x01\x00\x00\x00' * 128, 'little')  # 1 in every lane
+_BIT_CHARS = bytes.maketrans(b'\x00\x01', b'01')
+TOKEN_SPREAD_CACHE = 4096  # words; repetitive streams (logs, sensors) hash each word once
+
+@functools.lru_cache(maxsize=TOKEN_SPREAD_CACHE)
+def _token_spread(token: str) -> int:
+    h = hashlib.blake2b(token.encode('utf-8'), digest_size=16).digest()
+    return int.from_bytes(b''.join([_LANE_BYTES[byte] for byte in h]), 'little')
 
+def simhash128(text: str) -> bytes:
+    """128-bit SimHash of a text; similar texts land a small Hamming distance apart."""
+    counts = Counter(_WORD_RE.findall(text.lower()))
+    if not counts: return secrets.token_bytes(16)  # nothing to hash: keep the old random fill
+    acc, total = 0, 0
+    for token, weight in counts.items():
+        acc += weight * _token_spread(token); total += weight
+    # Bit i is set when lane i > total // 2: bias every lane so that its bit 31 says so
+    flags = ((acc + _LANE_ONES * ((1 << 31) - total // 2 - 1)) >> 31) & _LANE_ONES
+    bits = flags.to_bytes(512, 'little')[::4].translate(_BIT_CHARS)
+    return int(bits[::-1], 2).to_bytes(16, 'little')
+
+# File header: tag, version, block size, reserved Q, then two 24-byte tail
+# slots in what used to be padding. A slot is (seq, committed tail offset,
+# crc32c of those 16 bytes); writers alternate slots so a torn header write
+# can only ever damage the older one. Files written before the slots existed
+# have zeros there, which fail the slot CRC and trigger one full verify.
 HEADER_STRUCT = struct.Struct('<4s H H Q 48x')
-RECORD_STRUCT = struct.Struct('<B B H Q Q 16s H 214s I')
+TAIL_SLOT_STRUCT = struct.Struct('<Q Q I 4x')
+TAIL_SLOT_OFFSETS = (16, 40)
+_U16 = struct.Struct('<H'); _U32 = struct.Struct('<I'); _U64 = struct.Struct('<Q')
+
+# Block layout: the header fields are fixed, only the payload field grows
+_RECORD_STRUCTS: Dict[int, struct.Struct] = {}
+
+def record_struct(block_size: int = BLOCK_SIZE) -> struct.Struct:
+    rs = _RECORD_STRUCTS.get(block_size)
+    if rs is None: rs = _RECORD_STRUCTS[block_size] = struct.Struct(f'<B B H Q Q 16s H {block_size - RECORD_OVERHEAD}s I')
+    return rs
+
+def payload_capacity(block_size: int = BLOCK_SIZE) -> int:
+    return block_size - RECORD_OVERHEAD
+
+RECORD_STRUCT = record_struct(BLOCK_SIZE)
+
+def _map_file(path: str) -> Optional[mmap.mmap]:
+    """
+    Read-only mapping that is never closed explicitly: Record views keep it
+    alive through their memoryview, and it is released once the last one dies.
+    """
+    with open(path, 'rb') as f:
+        try: return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError: return None
+
+def _block_ok(view, pos: int, block_size: int = BLOCK_SIZE) -> bool:
+    return view[pos] == 0x01 and _U32.unpack_from(view, pos + block_size - 4)[0] == crc32c(view[pos + 1:pos + block_size - 4])
+
+def pack_record(rtype: int, agent_id: int, payload: bytes, semhash: bytes, link_offset: int = 0,
+                timestamp: Optional[int] = None, block_size: int = BLOCK_SIZE) -> bytes:
+    """One committed block (commit byte set, CRC filled in)."""
+    block = record_struct(block_size).pack(0x01, rtype, agent_id, timestamp or time.time_ns(), link_offset, semhash,
+                                           len(payload), payload.ljust(block_size - RECORD_OVERHEAD, b'\x00'), 0)
+    return block[:-4] + _U32.pack(crc32c(block[1:-4]))
+
+def pack_chain(agent_id: int, rtype: int, data: bytes, head_offset: int, semhash: bytes, link_offset: int = 0,
+               timestamp: Optional[int] = None, block_size: int = BLOCK_SIZE) -> List[bytes]:
+    """Head block plus RT_CONTINUATION blocks (2-byte seq + chunk, link = head_offset) for `data`."""
+    cap = block_size - RECORD_OVERHEAD
+    ts = timestamp or time.time_ns()
+    blocks = [pack_record(rtype, agent_id, data[:cap], semhash, link_offset, ts, block_size)]
+    for seq, i in enumerate(range(cap, len(data), cap - 2), 1):
+        blocks.append(pack_record(RT_CONTINUATION, agent_id, seq.to_bytes(2, 'little') + data[i:i + cap - 2],
+                                  semhash, head_offset, ts, block_size))
+    return blocks
+
+# ---------------------------
+# Record View
+# ---------------------------
+class Record:
+    """
+    Zero-copy view of one block inside a mapping. Header fields are decoded on
+    access and `payload` is a memoryview slice, so a scan allocates one small
+    object per block. rec['type'] style access is kept for dict-era callers;
+    use to_dict() for a detached copy that outlives the mapping.
+    """
+    __slots__ = ('_view', 'offset', 'id', '_payload')
+    FIELDS = ('id', 'offset', 'type', 'agent_id', 'timestamp', 'link', 'semhash16', 'payload_size', 'payload')
+
+    def __init__(self, view: memoryview, offset: int, record_id: int, payload: Optional[bytes] = None):
+        self._view = view
+        self.offset = offset
+        self.id = record_id
+        self._payload = payload  # set when the payload was stitched from continuations
+
+    def _rebind(self, offset: int, record_id: int) -> 'Record':
+        self.offset = offset; self.id = record_id
+        return self
+
+    @property
+    def type(self) -> int: return self._view[self.offset + 1]
+    @property
+    def agent_id(self) -> int: return _U16.unpack_from(self._view, self.offset + 2)[0]
+    @property
+    def timestamp(self) -> int: return _U64.unpack_from(self._view, self.offset + 4)[0]
+    @property
+    def link(self) -> int: return _U64.unpack_from(self._view, self.offset + 12)[0]
+    @property
+    def semhash16(self) -> bytes: return bytes(self._view[self.offset + 20:self.offset + 36])
+
+    @property
+    def payload_size(self) -> int:
+        if self._payload is not None: return len(self._payload)
+        return _U16.unpack_from(self._view, self.offset + 36)[0]
+
+    @property
+    def payload(self):
+        if self._payload is not None: return self._payload
+        start = self.offset + 38
+        return self._view[start:start + _U16.unpack_from(self._view, self.offset + 36)[0]]
+
+    def __getitem__(self, key: str):
+        if key not in Record.FIELDS: raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key: str, default=None):
+        return getattr(self, key) if key in Record.FIELDS else default
+
+    def __contains__(self, key) -> bool: return key in Record.FIELDS
+    def keys(self): return Record.FIELDS
+    def __iter__(self): return iter(Record.FIELDS)
+
+    def to_dict(self) -> Dict[str, Any]:
+        d = {k: getattr(self, k) for k in Record.FIELDS}
+        d['payload'] = bytes(d['payload'])
+        return d
+
+    def __repr__(self):
+        return f"Record(id={self.id}, offset={self.offset}, type={self.type}, agent_id={self.agent_id}, payload_size={self.payload_size})"
+
+# ---------------------------
+# CorthrexMem Class
+# ---------------------------
+def pack_tail_slot(seq: int, tail: int) -> bytes:
+    body = struct.pack('<Q Q', seq, tail)
+    return TAIL_SLOT_STRUCT.pack(seq, tail, crc32c(body))
+
+def pack_header(block_size: int = BLOCK_SIZE, tail: int = HEADER_SIZE) -> bytes:
+    """A fresh file header whose first tail slot already records `tail`."""
+    header = bytearray(HEADER_STRUCT.pack(FILE_TAG, 1, block_size, 0))
+    header[TAIL_SLOT_OFFSETS[0]:TAIL_SLOT_OFFSETS[0] + TAIL_SLOT_STRUCT.size] = pack_tail_slot(1, tail)
+    return bytes(header)
+
+def header_block_size(header: bytes) -> int:
+    """Block size recorded in a file header; unknown values fall back to the 256-byte default."""
+    if len(header) < HEADER_STRUCT.size: return BLOCK_SIZE
+    block_size = HEADER_STRUCT.unpack_from(header, 0)[2]
+    if block_size not in BLOCK_SIZES:
+        logger.warning(f"Header names unsupported block size {block_size}, assuming {BLOCK_SIZE}")
+        return BLOCK_SIZE
+    return block_size
+
+def read_tail_slot(header: bytes) -> Tuple[int, Optional[int]]:
+    """(seq, tail) of the newest valid slot, or (0, None) when neither checks out."""
+    best = (0, None)
+    for off in TAIL_SLOT_OFFSETS:
+        if len(header) < off + TAIL_SLOT_STRUCT.size: continue
+        seq, tail, crc = TAIL_SLOT_STRUCT.unpack_from(header, off)
+        if seq and crc == crc32c(header[off:off + 16]) and seq > best[0]: best = (seq, tail)
+    return best
+
+# ---------------------------
+# Payload cache
+# ---------------------------
+class PayloadCache:
+    """
+    Byte-budgeted LRU of reassembled payloads and decoded text, keyed by head
+    offset. Records never change once written, so entries stay valid until the
+    file is compacted or replaced (CorthrexMem clears the cache then). Only
+    chained payloads are stored; a single-block payload is a cheap slice.
+    A hit is a lookup served from the cache, a miss a value that had to be
+    computed and was then stored.
+    """
+    ENTRY_OVERHEAD = 120  # dict slot + list + object headers, roughly
+
+    def __init__(self, max_bytes: int = PAYLOAD_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: 'OrderedDict[int, list]' = OrderedDict()  # offset -> [payload or None, text or None, size]
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = self.misses = self.evictions = 0
+
+    def __len__(self): return len(self._entries)
+
+    def _get(self, offset: int, slot: int):
+        with self._lock:
+            entry = self._entries.get(offset)
+            if entry is None or entry[slot] is None: return None
+            self._entries.move_to_end(offset)
+            self.hits += 1
+            return entry[slot]
+
+    def _put(self, offset: int, slot: int, value, miss: bool):
+        with self._lock:
+            if miss: self.misses += 1
+            if len(value) > self.max_bytes // 4: return  # one huge record must not flush everything else
+            entry = self._entries.get(offset)
+            if entry is None: entry = self._entries[offset] = [None, None, 0]
+            entry[slot] = value
+            self._recount(entry)
+            self._entries.move_to_end(offset)
+            while self.bytes > self.max_bytes and len(self._entries) > 1:
+                _, old = self._entries.popitem(last=False)
+                self.bytes -= old[2]; self.evictions += 1
+
+    def _recount(self, entry: list):
+        size = self.ENTRY_OVERHEAD + sum(len(v) for v in entry[:2] if v is not None)
+        self.bytes += size - entry[2]; entry[2] = size
+
+    def get_payload(self, offset: int) -> Optional[bytes]: return self._get(offset, 0)
+    def get_text(self, offset: int) -> Optional[str]: return self._get(offset, 1)
+    def put_payload(self, offset: int, payload: bytes, miss: bool = True): self._put(offset, 0, payload, miss)
+    def put_text(self, offset: int, text: str, miss: bool = True): self._put(offset, 1, text, miss)
+
+    def clear(self):
+        with self._lock: self._entries.clear(); self.bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {'entries': len(self._entries), 'bytes': self.bytes, 'max_bytes': self.max_bytes, 'hits': self.hits,
+                'misses': self.misses, 'evictions': self.evictions, 'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0}
+
+# ---------------------------
+# Query
+# ---------------------------
+try:
+    _popcount = int.bit_count
+except AttributeError:  # Python < 3.10
+    _popcount = lambda x: bin(x).count('1')
+
+def _as_set(value) -> Optional[frozenset]:
+    if value is None: return None
+    return frozenset((value,)) if isinstance(value, int) else frozenset(value)
+
+class Query:
+    """
+    Composable, streaming read over a CorthrexMem:
+
+        mem.query().where(type=RT_USER_REQUEST, ts_between=(t0, t1)).select('timestamp', 'text').reassemble()
+
+    Header predicates (type, agent_id, agent_not, ts_between, link, similar_to)
+    are tested on the raw block bytes before the CRC check or any payload work;
+    payload predicates (contains, matching) only see blocks that passed them.
+    Continuation blocks are skipped unless RT_CONTINUATION is asked for, and
+    are stitched onto a head only when that head matches. Every builder call
+    returns a new Query, so a base query can be shared.
+
+    Indexes: a ts_between range binary-searches the file (timestamps are
+    written in append order; TS_ORDER_SLACK_NS absorbs clock steps),
+    similar_to uses a SimHashIndex given to using(), and at() restricts the
+    walk to known offsets.
+
+    verify(False) skips the per-block CRC (the commit byte is still checked)
+    for header-only passes whose caller verifies what it later reads.
+    """
+    FIELDS = Record.FIELDS + ('text',)
+
+    def __init__(self, mem: 'CorthrexMem'):
+        self.mem = mem
+        self._groups = ()       # AND of groups, each an OR of header clauses
+        self._contains = ()     # lowercase substrings the text must contain
+        self._predicates = ()   # callables on the Record
+        self._fields = None
+        self._reassemble = False
+        self._verify = True
+        self._reverse = False
+        self._limit = None
+        self._after = HEADER_SIZE
+        self._offsets = None
+        self._index = None
+
+    def _copy(self, **changes) -> 'Query':
+        q = copy.copy(self)
+        for k, v in changes.items(): setattr(q, k, v)
+        return q
+
+    # --- builders ---
+    @staticmethod
+    def _clause(type=None, agent_id=None, agent_not=None, ts_between=None, link=None, similar_to=None, radius=14) -> tuple:
+        ts = None
+        if ts_between is not None: ts = (ts_between[0] or 0, ts_between[1] if ts_between[1] is not None else (1 << 64) - 1)
+        sim = None
+        if similar_to is not None:
+            h = similar_to if isinstance(similar_to, (bytes, bytearray)) else simhash128(similar_to)
+            sim = (bytes(h), radius)
+        return (_as_set(type), _as_set(agent_id), _as_set(agent_not) or frozenset(), ts, _as_set(link), sim)
+
+    def where(self, contains: Optional[str] = None, matching=None, **header) -> 'Query':
+        """ANDs header predicates; `contains` is a case-insensitive text match, `matching` a callable on the Record."""
+        q = self._copy()
+        if header: q._groups = self._groups + ((self._clause(**header),),)
+        if contains: q._contains = self._contains + (contains.lower(),)
+        if matching is not None: q._predicates = self._predicates + (matching,)
+        return q
+
+    def where_any(self, *clauses: Dict[str, Any]) -> 'Query':
+        """A record passes if any one of the header clauses matches: where_any({'agent_id': 9999}, {'type': RT_SYS_DIAGNOSTIC})."""
+        return self._copy(_groups=self._groups + (tuple(self._clause(**c) for c in clauses),))
+
+    def select(self, *fields: str) -> 'Query':
+        bad = [f for f in fields if f not in Query.FIELDS]
+        if bad: raise ValueError(f"unknown fields {bad}; choose from {Query.FIELDS}")
+        return self._copy(_fields=fields)
+
+    def reassemble(self, enabled: bool = True) -> 'Query': return self._copy(_reassemble=enabled)
+    def verify(self, enabled: bool = True) -> 'Query': return self._copy(_verify=enabled)
+    def newest_first(self) -> 'Query': return self._copy(_reverse=True)
+    def limit(self, n: Optional[int]) -> 'Query': return self._copy(_limit=n)
+    def after(self, offset: int) -> 'Query': return self._copy(_after=max(HEADER_SIZE, offset))
+    def at(self, offsets) -> 'Query': return self._copy(_offsets=sorted(set(offsets)))
+    def using(self, index) -> 'Query': return self._copy(_index=index)
+
+    def first(self):
+        return next(iter(self.limit(1)), None)
+
+    def count(self) -> int:
+        return sum(1 for _ in self._copy(_fields=None))
+
+    # --- evaluation ---
+    def _header_ok(self, view, pos: int) -> bool:
+        rtype = view[pos + 1]
+        for group in self._groups:
+            for types, agents, agents_not, ts, links, sim in group:
+                if types is not None and rtype not in types: continue
+                if agents is not None or agents_not:
+                    agent = _U16.unpack_from(view, pos + 2)[0]
+                    if (agents is not None and agent not in agents) or agent in agents_not: continue
+                if ts is not None and not ts[0] <= _U64.unpack_from(view, pos + 4)[0] <= ts[1]: continue
+                if links is not None and _U64.unpack_from(view, pos + 12)[0] not in links: continue
+                if sim is not None and _popcount(int.from_bytes(sim[0], 'little') ^ int.from_bytes(view[pos + 20:pos + 36], 'little')) > sim[1]: continue
+                break
+            else:
+                return False
+        return True
+
+    def _bound(self, key: int) -> Optional[Tuple[int, int]]:
+        """Loosest (lo, hi) of field `key` (3 = ts) that every clause of some group imposes, else None."""
+        best = None
+        for group in self._groups:
+            if any(c[key] is None for c in group): continue
+            lo, hi = min(c[key][0] for c in group), max(c[key][1] for c in group)
+            best = (lo, hi) if best is None else (max(best[0], lo), min(best[1], hi))
+        return best
+
+    def _seek_ts(self, view, end: int, ts: int) -> int:
+        """First block position at or after which timestamps reach `ts`."""
+        bs = self.mem.block_size
+        lo, hi = 0, (end - HEADER_SIZE) // bs
+        while lo < hi:
+            mid = (lo + hi) // 2
+            probe = mid
+            while probe < hi and not _block_ok(view, HEADER_SIZE + probe * bs, bs): probe += 1
+            if probe == hi: hi = mid; continue
+            if _U64.unpack_from(view, HEADER_SIZE + probe * bs + 4)[0] < ts: lo = probe + 1
+            else: hi = mid
+        return HEADER_SIZE + lo * bs
+
+    def _candidates(self):
+        """Offsets an index narrows the walk to, or None for a range walk."""
+        offsets = None if self._offsets is None else set(self._offsets)
+        if self._index is not None:
+            for group in self._groups:
+                if all(c[5] is not None for c in group):
+                    self._index.sync()
+                    hits = {off for c in group for off, _ in self._index.lookup(c[5][0], c[5][1])}
+                    offsets = hits if offsets is None else offsets & hits
+        cont_map = self.mem._cont_map
+        if cont_map is not None:
+            for group in self._groups:
+                if all(c[0] == {RT_CONTINUATION} and c[4] is not None for c in group):
+                    hits = {e['offset'] for c in group for head in c[4] for e in cont_map.get(head, ())}
+                    offsets = hits if offsets is None else offsets & hits
+        return offsets
+
+    def _positions(self, view, end: int):
+        bs = self.mem.block_size
+        offsets = self._candidates()
+        if offsets is not None:
+            ordered = sorted(o for o in offsets if o >= self._after and o + bs <= end and (o - HEADER_SIZE) % bs == 0)
+            return reversed(ordered) if self._reverse else ordered
+        start, stop = self._after, end
+        ts = self._bound(3)
+        if ts is not None:
+            start = max(start, self._seek_ts(view, end, max(0, ts[0] - TS_ORDER_SLACK_NS)))
+            if ts[1] < (1 << 64) - 1 - TS_ORDER_SLACK_NS: stop = min(stop, self._seek_ts(view, end, ts[1] + TS_ORDER_SLACK_NS + 1))
+        start = HEADER_SIZE + (start - HEADER_SIZE + bs - 1) // bs * bs
+        return range(stop - bs - (stop - start) % bs, start - 1, -bs) if self._reverse else range(start, stop - bs + 1, bs)
+
+    def __iter__(self):
+        mem = self.mem
+        end = mem.get_tail_offset()
+        bs = mem.block_size
+        if self._limit is not None and self._limit <= 0: return
+        mm = _map_file(mem.path)
+        if mm is None: return
+        view = memoryview(mm)
+        end = min(end, len(view))
+        if end < HEADER_SIZE + bs: return
+        want_cont = any(c[0] is not None and RT_CONTINUATION in c[0] for g in self._groups for c in g)
+        need_text = bool(self._contains) or (self._fields is not None and 'text' in self._fields)
+        batch = [] if need_text and not self._contains else None  # texts decoded TEXT_BATCH rows at a time
+        yielded = 0
+        for pos in self._positions(view, end):
+            if view[pos] != 0x01: continue
+            rtype = view[pos + 1]
+            if rtype == RT_CONTINUATION and not want_cont: continue
+            if self._groups and not self._header_ok(view, pos): continue
+            if self._verify and not _block_ok(view, pos, bs): continue
+
+            rec = Record(view, pos, (pos - HEADER_SIZE) // bs)
+            if self._reassemble and rtype != RT_CONTINUATION and _U16.unpack_from(view, pos + 36)[0] >= mem.capacity:
+                rec._payload = mem._payload_at(view, pos)
+            text = None
+            if need_text:
+                # The cache holds whole-record text, so a head-only payload of a chain is decoded uncached
+                whole = rtype != RT_CONTINUATION and (self._reassemble or _U16.unpack_from(view, pos + 36)[0] < mem.capacity)
+                if batch is None: text = mem._text_at(pos, rec.payload) if whole else extract_text_fast(rec.payload)
+            if self._contains:
+                lowered = text.lower()
+                if not all(c in lowered for c in self._contains): continue
+            if self._predicates and not all(p(rec) for p in self._predicates): continue
+
+            if batch is not None:
+                batch.append((rec, pos if whole else None))
+                if len(batch) >= TEXT_BATCH: yield from self._rows(batch); batch = []
+            elif self._fields is None: yield rec
+            else: yield self._row(rec, text)
+            yielded += 1
+            if self._limit is not None and yielded >= self._limit: break
+        if batch: yield from self._rows(batch)
+
+    def _row(self, rec: Record, text: Optional[str]) -> Dict[str, Any]:
+        return {f: (text if f == 'text' else bytes(rec.payload) if f == 'payload' else getattr(rec, f)) for f in self._fields}
+
+    def _rows(self, batch):
+        texts = self.mem._texts_at([(head, rec.payload) for rec, head in batch])
+        for (rec, _), text in zip(batch, texts): yield self._row(rec, text)
 
 # ---------------------------
 # CorthrexMem Class
 # ---------------------------
 class CorthrexMem:
-    __slots__ = ('path', '_file_size', 'continuation_map')
+    __slots__ = ('path', 'block_size', 'capacity', '_file_size', '_cont_map', 'write_lock', '_tail', '_tail_seq', '_file_id', 'recovery', 'cache')
     
-    def __init__(self, path: str = 'corthrex.cxm'):
+    def __init__(self, path: str = 'corthrex.cxm', block_size: Optional[int] = None, cache_bytes: int = PAYLOAD_CACHE_BYTES):
+        """
+        block_size only applies when the file is created; an existing file keeps
+        the size in its header and asking for a different one is an error (use
+        mem_convert.py to change it).
+        """
+        if block_size is not None and block_size not in BLOCK_SIZES:
+            raise ValueError(f"block_size must be one of {BLOCK_SIZES}, got {block_size}")
         self.path = path
+        self.block_size = block_size or BLOCK_SIZE
+        self.capacity = payload_capacity(self.block_size)
         self._file_size = 0
-        self.continuation_map = {} 
+        self._cont_map = None  # built on first need; open does not pay for it
+        self.write_lock = threading.RLock()  # keeps a head and its continuations contiguous across threads
+        self._tail = HEADER_SIZE
+        self._tail_seq = 0
+        self._file_id = None
+        self.recovery = {}
+        self.cache = PayloadCache(cache_bytes)
         self._ensure_file()
-        self._rebuild_index()
+        self._recover_tail()
+        if block_size is not None and block_size != self.block_size:
+            raise ValueError(f"{path} uses {self.block_size}-byte blocks, not {block_size}; convert it with mem_convert.py")
 
     def _ensure_file(self):
         if not os.path.exists(self.path) or os.path.getsize(self.path) < HEADER_SIZE:
-            with open(self.path, 'wb') as f: f.write(HEADER_STRUCT.pack(FILE_TAG, 1, BLOCK_SIZE, 0))
+            with open(self.path, 'wb') as f: f.write(pack_header(self.block_size))
         self._file_size = os.path.getsize(self.path)
 
+    # ---------------------------
+    # Committed tail
+    # ---------------------------
+    def _recover_tail(self):
+        """
+        Open path. Trusts the header's committed tail and verifies only the
+        blocks written after it, skipping isolated bad blocks, so recovery costs
+        O(unverified tail) rather than O(file).
+        """
+        st = os.stat(self.path)
+        self._file_id = (st.st_dev, st.st_ino)
+        with open(self.path, 'rb') as f: header = f.read(HEADER_SIZE)
+        self.block_size = header_block_size(header)  # re-read: the file may have been converted underneath us
+        self.capacity = payload_capacity(self.block_size)
+        bs = self.block_size
+        seq, tail = read_tail_slot(header)
+        end = HEADER_SIZE + ((st.st_size - HEADER_SIZE) // bs) * bs
+        if tail is None or tail < HEADER_SIZE or tail > end or (tail - HEADER_SIZE) % bs:
+            tail = HEADER_SIZE  # no usable slot: verify everything once
+        self._tail_seq = seq
+        self._tail = tail
+        verified, bad = self._verify_from(tail, end)
+        self.recovery = {'header_tail': tail, 'tail': self._tail, 'verified_blocks': verified, 'bad_blocks': bad}
+        if self._tail != tail or seq == 0: self._write_tail_slot()
+        if bad: logger.warning(f"{self.path}: skipped {len(bad)} bad blocks after the committed tail: {bad[:8]}")
+
+    def _verify_from(self, start: int, end: int) -> Tuple[int, List[int]]:
+        """Extends the committed tail over the valid blocks in [start, end). Returns (blocks checked, bad offsets)."""
+        if end <= start: return 0, []
+        mm = _map_file(self.path)
+        if mm is None: return 0, []
+        view = memoryview(mm)
+        end = min(end, len(view))
+        bs = self.block_size
+        bad, checked, pos = [], 0, start
+        while pos + bs <= end:
+            checked += 1
+            if _block_ok(view, pos, bs): self._tail = pos + bs
+            else: bad.append(pos)
+            pos += bs
+        # Bad blocks past the last good one are a torn tail, not damage: appends overwrite them
+        return checked, [b for b in bad if b < self._tail]
+
+    def _write_tail_slot(self):
+        self._tail_seq += 1
+        slot = TAIL_SLOT_OFFSETS[self._tail_seq % 2]
+        try:
+            with open(self.path, 'r+b') as f:
+                f.seek(slot); f.write(pack_tail_slot(self._tail_seq, self._tail))
+        except OSError as e:
+            logger.warning(f"Could not update tail slot: {e}")
+
+    def _refresh_tail(self) -> int:
+        """Picks up blocks appended by other handles; re-opens from scratch if the file was replaced or shrank."""
+        st = os.stat(self.path)
+        self._file_size = st.st_size
+        if (st.st_dev, st.st_ino) != self._file_id or st.st_size < self._tail:
+            self._cont_map = None
+            self.cache.clear()  # compacted or replaced: offsets now name different records
+            self._recover_tail()
+        elif st.st_size >= self._tail + self.block_size:
+            bs = self.block_size
+            self._verify_from(self._tail, HEADER_SIZE + ((st.st_size - HEADER_SIZE) // bs) * bs)
+        return self._tail
+
+    # ---------------------------
+    # Continuation index (lazy)
+    # ---------------------------
+    @property
+    def continuation_map(self) -> Dict[int, List[Dict[str, Any]]]:
+        if self._cont_map is None: self._rebuild_index()
+        return self._cont_map
+
     def _rebuild_index(self):
-        self.continuation_map = {}
-        for record in self.scan_fast():
-            if record['type'] == RT_CONTINUATION:
-                link = record['link']
-                if link not in self.continuation_map:
-                    self.continuation_map[link] = []
-                self.continuation_map[link].append(record)
+        # Entries hold detached payload copies so the index never pins a mapping
+        cont_map = {}
+        for record in self.scan_fast(reuse=True):
+            if record.type == RT_CONTINUATION:
+                link = record.link
+                if link not in cont_map:
+                    cont_map[link] = []
+                cont_map[link].append({'offset': record.offset, 'payload': bytes(record.payload)})
         
-        for head in self.continuation_map:
-            self.continuation_map[head].sort(key=lambda r: int.from_bytes(r['payload'][:2], 'little'))
+        for head in cont_map:
+            cont_map[head].sort(key=lambda r: int.from_bytes(r['payload'][:2], 'little'))
+        self._cont_map = cont_map
 
     def __len__(self):
-        return (os.path.getsize(self.path) - HEADER_SIZE) // BLOCK_SIZE
+        return (self._refresh_tail() - HEADER_SIZE) // self.block_size
 
-    def __getitem__(self, idx: int) -> Optional[Dict[str, Any]]:
+    def __getitem__(self, idx: int) -> Optional[Record]:
         total = len(self)
         if idx < 0: idx += total
         if idx < 0 or idx >= total: raise IndexError("Index out of range")
         return self.get_record_by_id(idx)
 
-    def get_record_by_id(self, record_id: int) -> Optional[Dict[str, Any]]:
-        offset = HEADER_SIZE + (record_id * BLOCK_SIZE)
-        if offset + BLOCK_SIZE > os.path.getsize(self.path): return None
+    def get_record_by_id(self, record_id: int) -> Optional[Record]:
+        bs = self.block_size
+        offset = HEADER_SIZE + (record_id * bs)
+        if offset + bs > os.path.getsize(self.path): return None
         
-        try:
-            with open(self.path, 'rb') as f:
-                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
-                    block_data = mm[offset : offset + BLOCK_SIZE]
-                    stored_crc = struct.unpack_from('<I', block_data, -4)[0]
-                    calc_crc = crc32c(block_data[1:-4])
-                    if calc_crc != stored_crc: return None 
-                    
-                    _, rtype, agent_id, ts, link, semh, psz = RECORD_STRUCT.unpack_from(block_data, 0)[:7]
-                    payload = RECORD_STRUCT.unpack_from(block_data, 0)[7][:psz]
-                    
-                    return {
-                        'id': record_id,
-                        'offset': offset, 'type': rtype, 'agent_id': agent_id, 
-                        'timestamp': ts, 'link': link, 'semhash16': semh, 
-                        'payload_size': psz, 'payload': payload
-                    }
-        except ValueError: return None
+        mm = _map_file(self.path)
+        if mm is None or offset + bs > len(mm): return None
+        view = memoryview(mm)
+        if _U32.unpack_from(view, offset + bs - 4)[0] != crc32c(view[offset + 1:offset + bs - 4]): return None
+        return Record(view, offset, record_id)
 
-    def scan_fast(self) -> Generator[Dict[str, Any], None, None]:
-        self._file_size = os.path.getsize(self.path)
-        if self._file_size < HEADER_SIZE + BLOCK_SIZE: return
+    def get_record_at(self, offset: int) -> Optional[Record]:
+        return self.get_record_by_id((offset - HEADER_SIZE) // self.block_size)
+
+    def query(self) -> Query:
+        return Query(self)
+
+    def scan_fast(self, reuse: bool = False, start: int = HEADER_SIZE, strict: bool = False) -> Generator[Record, None, None]:
+        """
+        Forward scan up to the committed tail yielding Record views, optionally
+        from a block offset. Bad blocks are skipped (resynchronizing on the next
+        block boundary) unless strict=True, which stops at the first one.
+        With reuse=True the same Record object is re-pointed at each block, so
+        nothing is allocated per record; callers must not keep a reference past
+        the next iteration.
+        """
+        end = self._refresh_tail()
+        bs = self.block_size
+        if end < HEADER_SIZE + bs: return
         
-        with open(self.path, 'rb') as f:
-            if self._file_size == 0: return
-            try:
-                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
-                    pos = HEADER_SIZE
-                    record_counter = 0 
-                    while pos + BLOCK_SIZE <= len(mm):
-                        if mm[pos] != 0x01: break
-                        block_data = mm[pos:pos + BLOCK_SIZE]
-                        stored_crc = struct.unpack_from('<I', block_data, -4)[0]
-                        calc_crc = crc32c(block_data[1:-4])
-                        if calc_crc != stored_crc: break
-                        _, rtype, agent_id, ts, link, semh, psz = RECORD_STRUCT.unpack_from(mm, pos)[:7]
-                        payload = RECORD_STRUCT.unpack_from(mm, pos)[7][:psz]
-                        yield {
-                            'id': record_counter,
-                            'offset': pos, 'type': rtype, 'agent_id': agent_id, 
-                            'timestamp': ts, 'link': link, 'semhash16': semh, 
-                            'payload_size': psz, 'payload': payload
-                        }
-                        pos += BLOCK_SIZE
-                        record_counter += 1
-            except ValueError: return
-
-    def scan(self, filter_type: Optional[int] = None) -> Generator[Dict[str, Any], None, None]:
+        mm = _map_file(self.path)
+        if mm is None: return
+        view = memoryview(mm)
+        end = min(end, len(view))
+        shared = Record(view, HEADER_SIZE, 0) if reuse else None
+        record_counter = max(0, start - HEADER_SIZE) // bs
+        pos = HEADER_SIZE + record_counter * bs
+        while pos + bs <= end:
+            if _block_ok(view, pos, bs):
+                yield shared._rebind(pos, record_counter) if reuse else Record(view, pos, record_counter)
+            elif strict: break
+            pos += bs
+            record_counter += 1
+
+    def scan(self, filter_type: Optional[int] = None) -> Generator[Record, None, None]:
         for record in self.scan_fast():
-            if filter_type is None or record['type'] == filter_type:
+            if filter_type is None or record.type == filter_type:
                 yield record
 
+    def scan_reverse(self, limit: Optional[int] = None, filter_type=None) -> Generator[Record, None, None]:
+        """
+        Walks backward from the committed tail, newest record first.
+        Continuation blocks sit after their head, so chunks are collected on the
+        way back and stitched when the head is reached: every yielded record
+        carries its full reassembled payload. Torn or corrupt blocks are skipped.
+        filter_type may be a single record type or a collection of types.
+        """
+        if limit is not None and limit <= 0: return
+        if isinstance(filter_type, int): filter_type = (filter_type,)
+        tail = self.get_tail_offset()
+        bs = self.block_size
+        if tail < HEADER_SIZE + bs: return
+
+        mm = _map_file(self.path)
+        if mm is None: return
+        view = memoryview(mm)
+        pending = {}  # head offset -> [(seq, chunk), ...]
+        yielded = 0
+        pos = min(tail, len(view)) - bs
+        while pos >= HEADER_SIZE:
+            if not _block_ok(view, pos, bs):
+                pos -= bs; continue
+            rtype = view[pos + 1]
+
+            if rtype == RT_CONTINUATION and (filter_type is None or RT_CONTINUATION not in filter_type):
+                link = _U64.unpack_from(view, pos + 12)[0]
+                chunk = view[pos + 38:pos + 38 + _U16.unpack_from(view, pos + 36)[0]]
+                pending.setdefault(link, []).append((_U16.unpack_from(chunk, 0)[0], chunk[2:]))
+                pos -= bs; continue
+
+            chunks = pending.pop(pos, None)
+            if filter_type is None or rtype in filter_type:
+                rec = Record(view, pos, (pos - HEADER_SIZE) // bs)
+                if chunks:
+                    chunks.sort(key=lambda c: c[0])
+                    rec._payload = b''.join([rec.payload] + [c[1] for c in chunks])
+                yield rec
+                yielded += 1
+                if limit is not None and yielded >= limit: return
+            pos -= bs
+
     def get_tail_offset(self) -> int:
-        self._file_size = os.path.getsize(self.path)
-        return HEADER_SIZE + ((self._file_size - HEADER_SIZE) // BLOCK_SIZE) * BLOCK_SIZE
+        return self._refresh_tail()
 
-    def _append_record_fast(self, agent_id: int, rtype: int, payload: bytes, semhash: bytes, link_offset: int = 0) -> int:
-        tail = self.get_tail_offset()
-        record_data = RECORD_STRUCT.pack(0x00, rtype, agent_id, time.time_ns(), link_offset, semhash, len(payload), payload.ljust(214, b'\x00'), 0)
-        crc = crc32c(record_data[1:-4])
-        final_block = b'\x01' + record_data[1:-4] + struct.pack('<I', crc)
+    def _append_blocks(self, blocks: List[bytes], tail: Optional[int] = None) -> int:
+        """
+        Writes whole blocks (or buffers of several) at the tail with one write
+        and one fsync. Returns the first block's offset.
+        """
+        if tail is None: tail = self.get_tail_offset()
+        data = b''.join(blocks)
+        if len(data) % self.block_size: raise ValueError(f"{len(data)} bytes is not a whole number of {self.block_size}-byte blocks")
         with open(self.path, 'r+b') as f:
-            f.seek(tail); f.write(final_block); f.flush(); os.fsync(f.fileno())
+            f.seek(tail); f.write(data); f.flush(); os.fsync(f.fileno())
+        # The slot only ever names fsynced blocks; the next append's fsync carries it to disk
+        self._tail = tail + len(data)
+        self._file_size = max(self._file_size, self._tail)
+        self._write_tail_slot()
         return tail
 
-    def append_with_continuation(self, agent_id: int, rtype: int, data: bytes, link_offset: int = 0) -> List[int]:
-        semhash16 = secrets.token_bytes(16)
-        if len(data) <= 214: return [self._append_record_fast(agent_id, rtype, data, semhash16, link_offset)]
-        offsets, head_payload = [], data[:214]
-        head_offset = self._append_record_fast(agent_id, rtype, head_payload, semhash16, link_offset)
-        offsets.append(head_offset)
-        self.continuation_map[head_offset] = []
-        for seq, i in enumerate(range(214, len(data), 212), 1):
-            chunk = data[i:i + 212]
-            cont_payload = seq.to_bytes(2, 'little') + chunk
-            cont_offset = self._append_record_fast(agent_id, RT_CONTINUATION, cont_payload, semhash16, head_offset)
-            offsets.append(cont_offset)
-            self.continuation_map[head_offset].append({'offset': cont_offset, 'payload': cont_payload})
+    def _append_record_fast(self, agent_id: int, rtype: int, payload: bytes, semhash: bytes, link_offset: int = 0) -> int:
+        return self._append_blocks([pack_record(rtype, agent_id, payload, semhash, link_offset, block_size=self.block_size)])
+
+    def append_with_continuation(self, agent_id: int, rtype: int, data: bytes, link_offset: int = 0,
+                                 semhash16: Optional[bytes] = None, text: Optional[str] = None) -> List[int]:
+        """`text` is the already-decoded text of `data`, if the caller has it; it saves a re-parse."""
+        if semhash16 is None:
+            if text is None: text = extract_text_fast(data)
+            semhash16 = simhash128(text)
+        with self.write_lock: offsets = self._append_chain(agent_id, rtype, data, link_offset, semhash16)
+        # Write-through: the record just written is the one most likely to be read next
+        if len(offsets) > 1: self.cache.put_payload(offsets[0], bytes(data), miss=False)
+        if text is not None: self.cache.put_text(offsets[0], text, miss=False)
+        return offsets
+
+    def _append_chain(self, agent_id: int, rtype: int, data: bytes, link_offset: int, semhash16: bytes) -> List[int]:
+        # The whole chain goes down in one write: continuations link to the head offset, which is the current tail
+        bs = self.block_size
+        head_offset = self.get_tail_offset()
+        blocks = pack_chain(agent_id, rtype, data, head_offset, semhash16, link_offset, block_size=bs)
+        self._append_blocks(blocks, head_offset)
+        offsets = [head_offset + i * bs for i in range(len(blocks))]
+        if self._cont_map is not None and len(blocks) > 1:
+            self._cont_map[head_offset] = [{'offset': off, 'payload': block[38:38 + _U16.unpack_from(block, 36)[0]]}
+                                           for off, block in zip(offsets[1:], blocks[1:])]
         return offsets
 
     def reassemble_payload(self, head_offset: int) -> Optional[bytes]:
+        try: self._refresh_tail()  # one stat: drops the cache if the file was replaced under us
+        except OSError: return None
+        return self._reassemble(head_offset)
+
+    def _reassemble(self, head_offset: int) -> Optional[bytes]:
+        cached = self.cache.get_payload(head_offset)
+        if cached is not None: return cached
         try:
-            with open(self.path, 'rb') as f:
-                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
-                    if head_offset + BLOCK_SIZE > len(mm): return None
-                    _, _, _, _, _, _, psz = RECORD_STRUCT.unpack_from(mm, head_offset)[:7]
-                    head_payload = RECORD_STRUCT.unpack_from(mm, head_offset)[7][:psz]
-                    if psz < 214: return head_payload
-                    if head_offset in self.continuation_map:
-                        chunks = [head_payload]
-                        for rec in self.continuation_map[head_offset]:
-                            chunks.append(rec['payload'][2:]) 
-                        return b''.join(chunks)
-                    return head_payload
+            mm = _map_file(self.path)
+            if mm is None or head_offset + self.block_size > len(mm): return None
+            return self._payload_at(memoryview(mm), head_offset, lookup=False)
         except Exception: return None
 
-def _decode_leb128(data: bytes) -> Tuple[Optional[int], int]:
-    result, shift, bytes_read = 0, 0, 0
-    for i, byte in enumerate(data):
-        bytes_read += 1; result |= (byte & 0x7F) << shift
-        if not (byte & 0x80): return result, bytes_read
-        shift += 7
-        if shift >= 64: return None, bytes_read
-    return None, bytes_read
-
-def leb128_encode_fast(n: int) -> bytes:
-    if n == 0: return b'\x00'
-    result = bytearray()
-    while True:
-        byte = n & 0x7F; n >>= 7
-        if (n == 0 and not (byte & 0x40)) or (n == -1 and (byte & 0x40)):
-            result.append(byte); break
-        result.append(byte | 0x80)
-    return bytes(result)
-
-def encode_atom_fast(tag: int, val) -> bytes:
-    if tag == AT_BYTES:
-        data = val if isinstance(val, bytes) else str(val).encode('utf-8')
-        return bytes([AT_BYTES]) + leb128_encode_fast(len(data)) + data
-    elif tag == AT_INT:
-        return bytes([AT_INT]) + leb128_encode_fast(int(val))
-    raise ValueError(f'Unsupported atom tag: {tag}')
-
-def op_req(): return bytes([OP_REQ])
-def op_resp(): return bytes([OP_RESP])
-def op_end(): return bytes([OP_END])
-def op_push_key(kid: int): return bytes([OP_PUSH_KEY]) + kid.to_bytes(2, 'little')
-def op_push_val(tag: int, val): return bytes([OP_PUSH_VAL]) + encode_atom_fast(tag, val)
-def ops(*op_bytes: bytes): return b''.join(op_bytes)
-
-def extract_text_fast(eail_data: bytes) -> str:
-    try:
-        i = 0
-        while i < len(eail_data):
-            if eail_data[i] == OP_PUSH_VAL and i + 1 < len(eail_data) and eail_data[i+1] == AT_BYTES:
-                length, bytes_read = _decode_leb128(eail_data[i+2:])
-                if length is not None:
-                    start = i + 2 + bytes_read
-                    return eail_data[start : start + length].decode('utf-8', 'ignore')
-            i += 1
-        return eail_data.decode('utf-8', 'ignore').strip()
-    except Exception:
-        return "Binary data"
\ No newline at end of file
+    def get_text(self, head_offset: int) -> str:
+        """Decoded text of a record, continuations included, served from the cache when hot."""
+        try: self._refresh_tail()
+        except OSError: return ""
+        text = self.cache.get_text(head_offset)
+        if text is None:
+            payload = self._reassemble(head_offset)
+            if payload is None: return ""
+            text = extract_text_fast(payload)
+            self.cache.put_text(head_offset, text)
+        return text
+
+    def _payload_at(self, view: memoryview, head_offset: int, lookup: bool = True) -> bytes:
+        """Full payload of the head at head_offset; chained payloads go through the cache."""
+        psz = _U16.unpack_from(view, head_offset + 36)[0]
+        if psz < self.capacity: return bytes(view[head_offset + 38:head_offset + 38 + psz])
+        if lookup:
+            payload = self.cache.get_payload(head_offset)
+            if payload is not None: return payload
+        payload = self._stitch(view, head_offset)
+        self.cache.put_payload(head_offset, payload)
+        return payload
+
+    def _texts_at(self, items) -> List[str]:
+        """
+        Batch _text_at over (head_offset, payload) pairs; cache misses are decoded
+        in one extract_texts call. A None offset is decoded without caching.
+        """
+        texts = [self.cache.get_text(head) if head is not None else None for head, _ in items]
+        missing = [i for i, text in enumerate(texts) if text is None]
+        for i, text in zip(missing, extract_texts([items[i][1] for i in missing])):
+            texts[i] = text
+            if items[i][0] is not None: self.cache.put_text(items[i][0], text)
+        return texts
+
+    def get_texts(self, head_offsets: List[int]) -> List[str]:
+        """get_text for many records: one mapping, and one batch decode of everything not cached."""
+        try: self._refresh_tail()
+        except OSError: return [""] * len(head_offsets)
+        texts = [self.cache.get_text(head) for head in head_offsets]
+        missing = [i for i, text in enumerate(texts) if text is None]
+        if not missing: return texts
+        mm = _map_file(self.path)
+        view = memoryview(mm) if mm is not None else b''
+        items = []
+        for i in missing:
+            texts[i] = ""
+            head = head_offsets[i]
+            if head + self.block_size > len(view): continue
+            try: items.append((i, self._payload_at(view, head)))
+            except Exception: continue
+        for (i, _), text in zip(items, self._texts_at([(head_offsets[i], payload) for i, payload in items])): texts[i] = text
+        return texts
+
+    def _text_at(self, head_offset: int, payload) -> str:
+        text = self.cache.get_text(head_offset)
+        if text is None:
+            text = extract_text_fast(payload)
+            self.cache.put_text(head_offset, text)
+        return text
+
+    def _stitch(self, view: memoryview, head_offset: int) -> bytes:
+        """
+        Chains are written contiguously under write_lock, so the blocks right
+        after the head are walked first. A full last block followed by another
+        record (or the end of the file) is a payload that filled it exactly;
+        the continuation index is only built when the next block is damaged or
+        belongs to another chain.
+        """
+        bs, cap = self.block_size, self.capacity
+        psz = _U16.unpack_from(view, head_offset + 36)[0]
+        head_payload = bytes(view[head_offset + 38:head_offset + 38 + psz])
+        if psz < cap: return head_payload
+
+        chunks, pos, seq = [head_payload], head_offset + bs, 1
+        while pos + bs <= len(view):
+            if not _block_ok(view, pos, bs): break
+            if view[pos + 1] != RT_CONTINUATION: return b''.join(chunks)  # next record: the chain is complete
+            if _U64.unpack_from(view, pos + 12)[0] != head_offset or _U16.unpack_from(view, pos + 38)[0] != seq: break
+            csz = _U16.unpack_from(view, pos + 36)[0]
+            chunks.append(bytes(view[pos + 40:pos + 38 + csz]))
+            if csz < cap: return b''.join(chunks)  # short chunk ends the chain
+            pos += bs; seq += 1
+        else:
+            return b''.join(chunks)  # the chain runs to the end of the file
+
+        if head_offset in self.continuation_map:
+            chunks = [head_payload]
+            for rec in self.continuation_map[head_offset]:
+                chunks.append(rec['payload'][2:]) 
+            return b''.join(chunks)
+        return b''.join(chunks)
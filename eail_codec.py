@@ -0,0 +1,209 @@
+# eail_codec.py
+# Corthrex EAIL Bytecode Codec
+# Version: 1.0
+#
+# Op stream (one opcode byte, then its operand):
+#   OP_REQ / OP_RESP / OP_END / OP_BIND / OP_ASSERT   no operand
+#   OP_PUSH_KEY                                       u16 key id (little endian)
+#   OP_PUSH_VAL                                       atom
+# Atoms (one tag byte, then its body):
+#   AT_INT                                            signed LEB128
+#   AT_BYTES                                          LEB128 length + raw bytes
+#   AT_DICTID / AT_TEXTID                             unsigned LEB128 id
+#
+# Pure standard library on purpose: Read_MEM.py and other standalone tools
+# can import it without pulling in the storage layer.
+
+from collections import namedtuple
+from typing import Iterable, Iterator, List, Tuple
+
+OP_REQ = 0x06; OP_RESP = 0x07; OP_END = 0x09; OP_PUSH_KEY = 0x02
+OP_PUSH_VAL = 0x03; OP_BIND = 0x04; OP_ASSERT = 0x05
+AT_INT = 0x00; AT_BYTES = 0x04; AT_DICTID = 0x05; AT_TEXTID = 0x07
+
+Op = namedtuple('Op', 'code arg')
+Atom = namedtuple('Atom', 'tag value')
+
+class EAILDecodeError(ValueError):
+    pass
+
+# ---------------------------
+# LEB128
+# ---------------------------
+def uleb128_encode(n: int) -> bytes:
+    if n < 0: raise ValueError(f'Unsigned LEB128 cannot encode {n}')
+    if n < 0x80: return bytes((n,))
+    result = bytearray()
+    while n >= 0x80:
+        result.append((n & 0x7F) | 0x80); n >>= 7
+    result.append(n)
+    return bytes(result)
+
+def sleb128_encode(n: int) -> bytes:
+    if n == 0: return b'\x00'
+    result = bytearray()
+    while True:
+        byte = n & 0x7F; n >>= 7
+        if (n == 0 and not (byte & 0x40)) or (n == -1 and (byte & 0x40)):
+            result.append(byte); break
+        result.append(byte | 0x80)
+    return bytes(result)
+
+def uleb128_decode(data, pos: int = 0) -> Tuple[int, int]:
+    """Returns (value, next_pos). Single-byte values, the common case, skip the loop."""
+    b = data[pos]
+    if b < 0x80: return b, pos + 1
+    result, shift = b & 0x7F, 7
+    pos += 1
+    while True:
+        b = data[pos]; pos += 1
+        result |= (b & 0x7F) << shift
+        if b < 0x80: return result, pos
+        shift += 7
+        if shift >= 64: raise EAILDecodeError('LEB128 value exceeds 64 bits')
+
+def sleb128_decode(data, pos: int = 0) -> Tuple[int, int]:
+    result, shift = 0, 0
+    while True:
+        b = data[pos]; pos += 1
+        result |= (b & 0x7F) << shift
+        shift += 7
+        if b < 0x80:
+            if b & 0x40: result -= 1 << shift
+            return result, pos
+        if shift >= 64: raise EAILDecodeError('LEB128 value exceeds 64 bits')
+
+# ---------------------------
+# Encoder
+# ---------------------------
+def encode_atom(tag: int, val) -> bytes:
+    if tag == AT_BYTES:
+        data = val if isinstance(val, bytes) else str(val).encode('utf-8')
+        return bytes([AT_BYTES]) + sleb128_encode(len(data)) + data
+    elif tag == AT_INT:
+        return bytes([AT_INT]) + sleb128_encode(int(val))
+    elif tag in (AT_DICTID, AT_TEXTID):
+        return bytes([tag]) + uleb128_encode(int(val))
+    raise ValueError(f'Unsupported atom tag: {tag}')
+
+def op_req(): return bytes([OP_REQ])
+def op_resp(): return bytes([OP_RESP])
+def op_end(): return bytes([OP_END])
+def op_bind(): return bytes([OP_BIND])
+def op_assert(): return bytes([OP_ASSERT])
+def op_push_key(kid: int): return bytes([OP_PUSH_KEY]) + kid.to_bytes(2, 'little')
+def op_push_val(tag: int, val): return bytes([OP_PUSH_VAL]) + encode_atom(tag, val)
+def ops(*op_bytes: bytes): return b''.join(op_bytes)
+
+def encode(stream: Iterable[Op]) -> bytes:
+    """Inverse of decode(): turns a list of Op tuples back into bytecode."""
+    out = []
+    for op in stream:
+        if op.code == OP_PUSH_KEY: out.append(op_push_key(op.arg))
+        elif op.code == OP_PUSH_VAL: out.append(op_push_val(op.arg.tag, op.arg.value))
+        elif op.code in _NO_OPERAND: out.append(bytes([op.code]))
+        else: raise ValueError(f'Unsupported opcode: {op.code:#04x}')
+    return b''.join(out)
+
+# ---------------------------
+# Decoder (precompiled dispatch tables)
+# ---------------------------
+# Each handler takes (data, pos just past the tag/opcode) and returns (value, next_pos).
+# Truncated AT_BYTES bodies are clipped rather than rejected: a head block read
+# without its continuations is still worth displaying.
+def _atom_int(data, pos): return sleb128_decode(data, pos)
+def _atom_id(data, pos): return uleb128_decode(data, pos)
+def _atom_bytes(data, pos):
+    length, pos = uleb128_decode(data, pos)
+    return data[pos:pos + length], pos + length
+
+_ATOM_TABLE = [None] * 256
+_ATOM_TABLE[AT_INT] = _atom_int
+_ATOM_TABLE[AT_BYTES] = _atom_bytes
+_ATOM_TABLE[AT_DICTID] = _atom_id
+_ATOM_TABLE[AT_TEXTID] = _atom_id
+
+def _op_none(data, pos): return None, pos
+def _op_push_key(data, pos):
+    if pos + 2 > len(data): raise IndexError
+    return data[pos] | (data[pos + 1] << 8), pos + 2
+def _op_push_val(data, pos):
+    tag = data[pos]
+    handler = _ATOM_TABLE[tag]
+    if handler is None: raise EAILDecodeError(f'Unknown atom tag {tag:#04x} at {pos}')
+    value, pos = handler(data, pos + 1)
+    return Atom(tag, value), pos
+
+_NO_OPERAND = (OP_REQ, OP_RESP, OP_END, OP_BIND, OP_ASSERT)
+_OP_TABLE = [None] * 256
+for _code in _NO_OPERAND: _OP_TABLE[_code] = _op_none
+_OP_TABLE[OP_PUSH_KEY] = _op_push_key
+_OP_TABLE[OP_PUSH_VAL] = _op_push_val
+_HEAD_OPS = frozenset((OP_REQ, OP_RESP))
+
+def iter_ops(data) -> Iterator[Op]:
+    """Streams Op tuples; raises EAILDecodeError on unknown opcodes or truncation."""
+    pos, end = 0, len(data)
+    while pos < end:
+        code = data[pos]
+        handler = _OP_TABLE[code]
+        if handler is None: raise EAILDecodeError(f'Unknown opcode {code:#04x} at {pos}')
+        try: arg, pos = handler(data, pos + 1)
+        except IndexError: raise EAILDecodeError(f'Truncated operand for opcode {code:#04x}') from None
+        yield Op(code, arg)
+
+def decode(data, strict: bool = True) -> List[Op]:
+    """Parses a whole payload. With strict=False a bad tail is dropped instead of raising."""
+    out = []
+    try:
+        for op in iter_ops(data): out.append(op)
+    except EAILDecodeError:
+        if strict: raise
+    return out
+
+# ---------------------------
+# Text extraction
+# ---------------------------
+def _legacy_text(data) -> str:
+    # Non-conforming payloads: first PUSH_VAL/AT_BYTES pair anywhere, else raw bytes
+    i = bytes(data).find(bytes((OP_PUSH_VAL, AT_BYTES)))
+    if i >= 0:
+        try:
+            value, _ = _atom_bytes(data, i + 2)
+            return str(value, 'utf-8', 'ignore')
+        except (IndexError, EAILDecodeError): pass
+    return str(data, 'utf-8', 'ignore').strip()
+
+def extract_text(data) -> str:
+    """Text of the first AT_BYTES value in a payload (bytes or memoryview)."""
+    try:
+        # Canonical record: <REQ|RESP> PUSH_VAL AT_BYTES <len> <utf-8>
+        if len(data) > 3 and data[0] in _HEAD_OPS and data[1] == OP_PUSH_VAL and data[2] == AT_BYTES:
+            try:
+                value, _ = _atom_bytes(data, 3)
+                return str(value, 'utf-8', 'ignore')
+            except IndexError: pass
+        try:
+            for code, arg in iter_ops(data):
+                if code == OP_PUSH_VAL and arg.tag == AT_BYTES:
+                    return str(arg.value, 'utf-8', 'ignore')
+        except EAILDecodeError: pass
+        return _legacy_text(data)
+    except Exception:
+        return "Binary data"
+
+def extract_texts(payloads: Iterable) -> List[str]:
+    """
+    Batch form of extract_text for a scan's worth of payloads: the canonical
+    short-text layout (one-byte length) is sliced inline, anything else goes
+    through extract_text.
+    """
+    out = []
+    append = out.append
+    head_ops, push_val, at_bytes = _HEAD_OPS, OP_PUSH_VAL, AT_BYTES
+    for data in payloads:
+        if len(data) > 4 and data[0] in head_ops and data[1] == push_val and data[2] == at_bytes and data[3] < 0x80:
+            append(str(data[4:4 + data[3]], 'utf-8', 'ignore'))
+        else:
+            append(extract_text(data))
+    return out
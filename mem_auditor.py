@@ -2,7 +2,6 @@
 # Corthrex Integrity Auditor (Chat Compatible)
 
 import os
-import shutil
 import time
 import struct
 import sys
@@ -13,13 +12,21 @@ import contextlib
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 try:
     import eail
+    import mem_backup
+    import mem_merkle
+    import mem_jobs
 except ImportError:
     pass # Handled by main script usually
 
 class MemAuditor:
-    def __init__(self, ark_path='corthrex.cxm'):
+    def __init__(self, ark_path='corthrex.cxm', write_lock=None):
         self.ark_path = ark_path
+        # The live handle's lock when auditing a file that is being written to: the scan runs
+        # without it, only the catch-up on blocks appended meanwhile and the swap hold it
+        self.write_lock = write_lock or contextlib.nullcontext()
         self.backup_path = ''
+        self.tampered = False
+        self.rewrote = False
         self.stats = {
             'start_time': time.time(),
             'original_size': 0, 'final_size': 0,
@@ -40,69 +47,130 @@ class MemAuditor:
             return False
 
         self.stats['original_size'] = os.path.getsize(self.ark_path)
-        timestamp = time.strftime("%Y-%m-%d-%H%M%S")
-        self.backup_path = f"{self.ark_path}.{timestamp}.bak"
-        
+
+        # Incremental: only blocks added since the last audit are copied. If a
+        # previous repair rewrote the file, the old replica is rotated aside.
         try:
-            shutil.copy2(self.ark_path, self.backup_path)
-            self.log(f"[INFO] Backup secured: {os.path.basename(self.backup_path)}")
+            backup = mem_backup.IncrementalBackup(self.ark_path)
+            shipped = backup.sync(log=lambda msg: None)
+            self.backup_path = backup.replica_path
+            if shipped['rotated']: self.log(f"[INFO] Previous replica kept as {os.path.basename(shipped['rotated'])}")
+            self.log(f"[INFO] Backup secured: {os.path.basename(self.backup_path)} (+{shipped['shipped_bytes']:,} bytes)")
             return True
         except Exception as e:
             self.log(f"[FATAL] Backup failed: {e}")
             return False
 
-    def audit_and_repair(self):
+    def _merkle_audit(self, merkle, full=False):
+        """
+        Verifies what changed since the last trusted root and spot-checks older
+        blocks (full: re-hashes all of them). Returns True when that is enough,
+        False when a CRC scan is needed (no root yet, CRC damage, or evidence of
+        tampering). A quick pass can miss an edit to old data; only full rules it out.
+        """
+        if not merkle.trusted_root(): return False
+        report = merkle.verify(full=full)
+        if not report['ok']:
+            # A changed block that still passes its CRC was rewritten on purpose; one that fails is plain damage
+            bs = merkle.mem.block_size
+            with open(self.ark_path, 'rb') as f:
+                def crc_ok(off):
+                    f.seek(off); return eail._block_ok(f.read(bs), 0, bs)
+                self.tampered = len(report['changed']) < len(report['problems']) or any(crc_ok(off) for off in report['changed'])
+            if self.tampered:
+                self.log("[ALERT] Tamper evidence: data changed under a trusted root.")
+                for problem in report['problems']: self.log(f"[ALERT] {problem}")
+            else:
+                self.log(f"[WARN] {len(report['changed'])} blocks damaged under the trusted root.")
+            return False
+        if report['bad_blocks']:
+            self.log(f"[WARN] {len(report['bad_blocks'])} damaged blocks since the last trusted root.")
+            return False
+        checked = "all re-hashed" if full else f"{report['spot_checked']} spot-checked"
+        self.log(f"[OK] Trusted root covers {report['trusted_size']} blocks ({checked}).")
+        self.log(f"[OK] Verified {report['new_blocks']} new blocks.")
+        if report['new_blocks'] and not full:  # a full audit checkpoints after its CRC scan
+            entry = merkle.checkpoint()
+            self.log(f"[OK] New root {entry['root'][:16]}… at {entry['size']} blocks")
+        return True
+
+    def _scan_blocks(self, f, block_size, valid_records_data, end=None):
+        """CRC-checks blocks from the current position up to `end` (EOF if None)."""
+        paced = end is not None  # the catch-up under write_lock must not pause for chat requests
+        while end is None or f.tell() < end:
+            block_offset = f.tell()
+            block_data = f.read(block_size)
+            if not block_data: break
+
+            self.stats['total_records_scanned'] += 1
+            if paced: mem_jobs.pace(block_offset, end, len(block_data))
+
+            if len(block_data) == block_size:
+                stored_crc = struct.unpack_from('<I', block_data, block_size - 4)[0]
+                calculated_crc = eail.crc32c(block_data[1:-4])
+                commit_byte = block_data[0]
+
+                if commit_byte == 0x01 and stored_crc == calculated_crc:
+                    self.stats['valid_records_found'] += 1
+                    valid_records_data.append(block_data)
+                else:
+                    self.stats['corrupt_records_found'] += 1
+                    self.stats['corrupt_offsets'].append(block_offset)
+            else:
+                self.stats['corrupt_records_found'] += 1
+                self.stats['corrupt_offsets'].append(block_offset)
+
+    def audit_and_repair(self, full=False):
         self.log("🔎 **CORTHREX INTEGRITY SCAN**")
         self.log("--------------------------------")
 
         if not self._create_backup(): return self.log_buffer.getvalue()
 
+        merkle = mem_merkle.MerkleLog(eail.CorthrexMem(self.ark_path))
+        # Full: every block is re-hashed against the trusted root before anything is re-signed
+        if self._merkle_audit(merkle, full) and not full: return self.log_buffer.getvalue()
+
         valid_records_data = []
         temp_ark_path = self.ark_path + ".tmp"
 
         try:
+            with self.write_lock: end = os.path.getsize(self.ark_path)  # no append is half-written right now
             with open(self.ark_path, 'rb') as f:
                 header = f.read(eail.HEADER_SIZE)
                 if not header or len(header) < eail.HEADER_SIZE:
                     self.log("[FATAL] Header corrupted.")
                     return self.log_buffer.getvalue()
                 valid_records_data.append(header)
-
-                while True:
-                    block_offset = f.tell()
-                    block_data = f.read(eail.BLOCK_SIZE)
-                    if not block_data: break
-
-                    self.stats['total_records_scanned'] += 1
-
-                    if len(block_data) == eail.BLOCK_SIZE:
-                        stored_crc = struct.unpack_from('<I', block_data, eail.BLOCK_SIZE - 4)[0]
-                        calculated_crc = eail.crc32c(block_data[1:-4])
-                        commit_byte = block_data[0]
-
-                        if commit_byte == 0x01 and stored_crc == calculated_crc:
-                            self.stats['valid_records_found'] += 1
-                            valid_records_data.append(block_data)
-                        else:
-                            self.stats['corrupt_records_found'] += 1
-                            self.stats['corrupt_offsets'].append(block_offset)
-                    else:
-                        self.stats['corrupt_records_found'] += 1
-                        self.stats['corrupt_offsets'].append(block_offset)
-
-            if self.stats['corrupt_records_found'] > 0:
-                self.log(f"[WARN] Found {self.stats['corrupt_records_found']} corrupt records.")
-                self.log("[ACTION] Rebuilding memory file...")
-                with open(temp_ark_path, 'wb') as temp_f:
-                    for data in valid_records_data: temp_f.write(data)
-                
-                os.remove(self.ark_path)
-                os.rename(temp_ark_path, self.ark_path)
+                block_size = eail.header_block_size(header)
+                self._scan_blocks(f, block_size, valid_records_data, end)
+
+                if self.stats['corrupt_records_found'] > 0:
+                    self.log(f"[WARN] Found {self.stats['corrupt_records_found']} corrupt records.")
+                    self.log("[ACTION] Rebuilding memory file...")
+                    with self.write_lock:
+                        # Appends that landed during the scan are checked and carried over like the rest
+                        self._scan_blocks(f, block_size, valid_records_data)
+                        with open(temp_ark_path, 'wb') as temp_f:
+                            # Fresh header: the old tail slot would point past the compacted data
+                            valid_records_data[0] = eail.pack_header(block_size, tail=eail.HEADER_SIZE + (len(valid_records_data) - 1) * block_size)
+                            for data in valid_records_data: temp_f.write(data)
+                            temp_f.flush(); os.fsync(temp_f.fileno())
+                        os.replace(temp_ark_path, self.ark_path)
+                    self.rewrote = True
+
+            if self.rewrote:
                 self.log("[SUCCESS] Rebuild complete.")
+                merkle = mem_merkle.MerkleLog(eail.CorthrexMem(self.ark_path))
+                merkle.reset()
             else:
                 self.log(f"[OK] scanned {self.stats['total_records_scanned']} blocks.")
                 self.log("[OK] Structure Integrity: 100%")
 
+            # Never re-sign over tamper evidence; a clean or repaired file gets a fresh root
+            if not self.tampered:
+                entry = merkle.checkpoint(note="repair" if self.stats['corrupt_records_found'] else "")
+                self.log(f"[OK] Trusted root {entry['root'][:16]}… at {entry['size']} blocks")
+
         except Exception as e:
             self.log(f"[FATAL] Audit Error: {e}")
         
@@ -0,0 +1,177 @@
+# mem_backup.py
+# Corthrex Incremental Backup & Replication
+# Usage: python mem_backup.py [memory_file] [target]            ship new blocks
+#        python mem_backup.py [memory_file] [target] --verify   re-check the whole replica
+#        python mem_backup.py [memory_file] [target] --restore  bring the memory file back from the replica
+#
+# The memory file only ever grows, so a replica is "the same bytes up to some
+# offset". Each run ships the committed blocks past that offset, reads them
+# back to verify, and records the new offset plus a rolling checksum in a
+# small JSON state file next to the replica. `target` may be a file or a
+# directory (a local stand-in for a remote); a directory gets a file of the
+# same name inside it.
+#
+# If the source no longer matches the replica (a doctor or auditor pass
+# rewrote it), the old replica is renamed to a timestamped .bak and a full
+# copy starts over: the pre-compaction history is kept, not overwritten.
+
+import os
+import sys
+import json
+import time
+import zlib
+import argparse
+from typing import Dict, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import eail
+import mem_jobs
+
+# --- Configuration ---
+MEMORY_FILE = "corthrex.cxm"
+REPLICA_SUFFIX = ".replica"
+STATE_SUFFIX = ".state"
+COPY_CHUNK = 4 * 1024 * 1024   # rounded down to whole blocks
+
+class IncrementalBackup:
+    def __init__(self, src_path: str = MEMORY_FILE, target: Optional[str] = None):
+        self.src_path = src_path
+        target = target or src_path + REPLICA_SUFFIX
+        self.replica_path = os.path.join(target, os.path.basename(src_path)) if os.path.isdir(target) else target
+        self.state_path = self.replica_path + STATE_SUFFIX
+
+    # ---------------------------
+    # State
+    # ---------------------------
+    def _load_state(self) -> Optional[Dict]:
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f: return json.load(f)
+        except (OSError, ValueError): return None
+
+    def _save_state(self, state: Dict):
+        tmp = self.state_path + ".tmp"
+        with open(tmp, 'w', encoding='utf-8') as f: json.dump(state, f)
+        os.replace(tmp, self.state_path)
+
+    def _same_block(self, offset: int, block_size: int) -> bool:
+        """Source and replica agree on the block that ends at `offset` (O(1) divergence check)."""
+        if offset <= eail.HEADER_SIZE: return True
+        start = offset - block_size
+        with open(self.src_path, 'rb') as a, open(self.replica_path, 'rb') as b:
+            a.seek(start); b.seek(start)
+            return a.read(block_size) == b.read(block_size)
+
+    def _rotate(self):
+        rotated = f"{self.replica_path}.{time.strftime('%Y-%m-%d-%H%M%S')}.bak"
+        os.replace(self.replica_path, rotated)
+        if os.path.exists(self.state_path): os.remove(self.state_path)
+        return rotated
+
+    # ---------------------------
+    # Ship
+    # ---------------------------
+    def sync(self, log=print) -> Dict:
+        """Copies the committed blocks added since the last run. Returns shipping stats."""
+        if not os.path.exists(self.src_path): raise FileNotFoundError(self.src_path)
+        mem = eail.CorthrexMem(self.src_path)
+        tail, bs = mem.get_tail_offset(), mem.block_size
+        state = self._load_state()
+        stats = {'replica': self.replica_path, 'shipped_bytes': 0, 'full_copy': False, 'rotated': None}
+
+        if state and os.path.exists(self.replica_path):
+            shipped = state['shipped']
+            if shipped > tail or state.get('block_size', bs) != bs or not self._same_block(shipped, bs):
+                stats['rotated'] = self._rotate()
+                log(f"[BACKUP] Source was rewritten; previous replica kept as {os.path.basename(stats['rotated'])}")
+                state = None
+        elif os.path.exists(self.replica_path):
+            stats['rotated'] = self._rotate()  # replica without state cannot be trusted as a prefix
+            state = None
+
+        if state is None:
+            state = {'shipped': eail.HEADER_SIZE, 'checksum': 0, 'block_size': bs}
+            stats['full_copy'] = True
+            with open(self.replica_path, 'wb'): pass
+
+        start, checksum = state['shipped'], state['checksum']
+        chunk_size = max(bs, COPY_CHUNK // bs * bs)
+        with open(self.src_path, 'rb') as src, open(self.replica_path, 'r+b') as dst:
+            # Header first: its tail slots change on every append
+            src.seek(0); dst.seek(0); dst.write(src.read(eail.HEADER_SIZE))
+            pos = start
+            while pos < tail:
+                src.seek(pos)
+                data = src.read(min(chunk_size, tail - pos))
+                if not data: break
+                dst.seek(pos); dst.write(data); dst.flush()
+                dst.seek(pos)
+                if dst.read(len(data)) != data: raise IOError(f"Replica verification failed at offset {pos}")
+                checksum = zlib.crc32(data, checksum)
+                pos += len(data)
+                mem_jobs.pace(pos - start, tail - start, len(data))
+            os.fsync(dst.fileno())
+
+        stats['shipped_bytes'] = pos - start
+        self._save_state({'shipped': pos, 'checksum': checksum, 'block_size': bs, 'updated': time.time()})
+        log(f"[BACKUP] {'Full copy' if stats['full_copy'] else 'Incremental'}: +{stats['shipped_bytes']:,} bytes -> {os.path.basename(self.replica_path)}")
+        return stats
+
+    # ---------------------------
+    # Verify / restore
+    # ---------------------------
+    def verify(self) -> bool:
+        """Full pass over the replica against the recorded rolling checksum."""
+        state = self._load_state()
+        if not state or not os.path.exists(self.replica_path): return False
+        checksum, pos = 0, eail.HEADER_SIZE
+        with open(self.replica_path, 'rb') as f:
+            f.seek(pos)
+            while pos < state['shipped']:
+                data = f.read(min(COPY_CHUNK, state['shipped'] - pos))
+                if not data: return False
+                checksum = zlib.crc32(data, checksum); pos += len(data)
+        return checksum == state['checksum']
+
+    def restore(self, dest: Optional[str] = None, log=print) -> int:
+        """
+        Brings `dest` (default: the source path) back to the replica. The file is
+        compared chunk by chunk and only chunks that differ are rewritten, so a
+        truncated or locally damaged file costs a read, not a full copy.
+        Returns bytes written.
+        """
+        dest = dest or self.src_path
+        state = self._load_state()
+        if not state or not os.path.exists(self.replica_path): raise FileNotFoundError("No replica to restore from")
+        end, written = state['shipped'], 0
+
+        if not os.path.exists(dest): open(dest, 'wb').close()
+        with open(self.replica_path, 'rb') as src, open(dest, 'r+b') as dst:
+            pos = 0
+            while pos < end:
+                n = eail.HEADER_SIZE if pos == 0 else min(COPY_CHUNK, end - pos)
+                src.seek(pos); want = src.read(n)
+                if not want: break
+                dst.seek(pos)
+                if dst.read(len(want)) != want:
+                    dst.seek(pos); dst.write(want); written += len(want)
+                pos += len(want)
+            dst.truncate(end)
+            dst.flush(); os.fsync(dst.fileno())
+        log(f"[RESTORE] {dest}: rewrote {written:,} of {end:,} bytes from replica")
+        return written
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental backup / replication for .cxm memory files")
+    parser.add_argument('source', nargs='?', default=MEMORY_FILE)
+    parser.add_argument('target', nargs='?', default=None, help="replica file or directory (default: <source>.replica)")
+    parser.add_argument('--verify', action='store_true', help="re-check the whole replica against its checksum")
+    parser.add_argument('--restore', action='store_true', help="restore the source file from the replica")
+    args = parser.parse_args()
+
+    backup = IncrementalBackup(args.source, args.target)
+    if args.restore: backup.restore()
+    elif args.verify: print("[VERIFY] Replica OK" if backup.verify() else "[VERIFY] Replica does NOT match its checksum")
+    else: backup.sync()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# mem_convert.py
+# Corthrex Block Size Converter
+# Usage: python mem_convert.py [memory_file] --block-size 4096            convert in place (original kept as .bak)
+#        python mem_convert.py [memory_file] --block-size 512 -o out.cxm  write a converted copy
+#
+# Rewrites every record into blocks of the new size. Payloads are reassembled
+# and re-chunked, so a long response that took 20 blocks at 256 bytes takes
+# 2 at 4096. Offsets change with the block size, so links are remapped: a
+# continuation points at its new head, and summary records get new link,
+# first and last offsets. Timestamps, agents and semhashes are kept as they are.
+# The .simidx and .doctrine sidecars notice the rewrite and rebuild themselves; a .merkle
+# sidecar is reset and checkpointed with note "rewrite".
+
+import os
+import sys
+import time
+import argparse
+from typing import Dict
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import eail
+import mem_rollup
+import mem_merkle
+
+# --- Configuration ---
+MEMORY_FILE = "corthrex.cxm"
+
+def convert(src_path: str, dst_path: str, block_size: int, log=print) -> Dict:
+    if block_size not in eail.BLOCK_SIZES: raise ValueError(f"block size must be one of {eail.BLOCK_SIZES}")
+    mem = eail.CorthrexMem(src_path)
+    stats = {'records': 0, 'blocks_before': len(mem), 'blocks_after': 0, 'unmapped_links': 0,
+             'from_block_size': mem.block_size, 'to_block_size': block_size}
+
+    offset_map: Dict[int, int] = {}  # old head offset -> new head offset
+    def remap(offset: int) -> int:
+        if not offset: return 0
+        new = offset_map.get(offset)
+        if new is None: stats['unmapped_links'] += 1; return 0
+        return new
+
+    tmp_path = dst_path + ".tmp"
+    pos = eail.HEADER_SIZE
+    with open(tmp_path, 'wb') as out:
+        out.write(eail.pack_header(block_size))
+        for rec in mem.scan_fast():
+            if rec.type == eail.RT_CONTINUATION: continue
+            data = mem.reassemble_payload(rec.offset)
+            if data is None: continue
+            if rec.type == eail.RT_SUMMARY:
+                info = mem_rollup.parse_summary(data)
+                if info:
+                    data = mem_rollup.encode_summary(info['level'], remap(info['first']), remap(info['last']),
+                                                     info['start_ts'], info['end_ts'], info['count'], info['text'])
+            blocks = eail.pack_chain(rec.agent_id, rec.type, data, pos, rec.semhash16, remap(rec.link),
+                                     rec.timestamp, block_size)
+            out.write(b''.join(blocks))
+            offset_map[rec.offset] = pos
+            pos += len(blocks) * block_size
+            stats['records'] += 1
+        out.seek(0); out.write(eail.pack_header(block_size, tail=pos))
+        out.flush(); os.fsync(out.fileno())
+
+    stats['blocks_after'] = (pos - eail.HEADER_SIZE) // block_size
+    stats['bytes_before'] = eail.HEADER_SIZE + stats['blocks_before'] * stats['from_block_size']
+    stats['bytes_after'] = pos
+    if os.path.abspath(src_path) == os.path.abspath(dst_path):
+        stats['backup'] = f"{src_path}.{stats['from_block_size']}.{time.strftime('%Y-%m-%d-%H%M%S')}.bak"
+        os.replace(src_path, stats['backup'])
+    os.replace(tmp_path, dst_path)
+    stats['merkle_root'] = mem_merkle.checkpoint_rewrite(dst_path)
+
+    log(f"[CONVERT] {stats['records']} records: {stats['blocks_before']} x {stats['from_block_size']}B "
+        f"-> {stats['blocks_after']} x {block_size}B ({stats['bytes_before']:,} -> {stats['bytes_after']:,} bytes)")
+    if stats['unmapped_links']: log(f"[CONVERT] {stats['unmapped_links']} links pointed at missing records and were cleared")
+    if stats['merkle_root']: log(f"[CONVERT] Trusted root {stats['merkle_root']['root'][:16]}… at {stats['merkle_root']['size']} blocks")
+    if 'backup' in stats: log(f"[CONVERT] Original kept as {os.path.basename(stats['backup'])}")
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a .cxm memory file to another block size")
+    parser.add_argument('source', nargs='?', default=MEMORY_FILE)
+    parser.add_argument('--block-size', type=int, required=True, choices=eail.BLOCK_SIZES)
+    parser.add_argument('-o', '--output', default=None, help="write here instead of converting in place")
+    args = parser.parse_args()
+    convert(args.source, args.output or args.source, args.block_size)
+
+if __name__ == "__main__":
+    main()
@@ -3,15 +3,19 @@
 # Usage: python mem_doctor.py
 
 import os
-import shutil
 import time
 import requests
 import sys
+import contextlib
 
 # Ensure eail is importable
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 try:
     import eail
+    import mem_backup
+    import content_filter
+    import mem_jobs
+    import mem_merkle
 except ImportError:
     print("[FATAL] eail.py not found.")
     sys.exit(1)
@@ -21,27 +25,34 @@ MEMORY_FILE = "corthrex.cxm"
 MODEL_NAME = "phi4-q5:latest"
 OLLAMA_URL = "http://localhost:11434/api/generate"
 SAFE_DELETE_THRESHOLD = 0.25 
+SCAN_BATCH = 500          # records screened per content-filter pass
 
 class MemDoctor:
-    def __init__(self, mem_path=MEMORY_FILE):
+    def __init__(self, mem_path=MEMORY_FILE, write_lock=None):
         self.mem_path = mem_path
+        # Live handle's lock: held only while blocks appended during the scan are carried over and the file swapped
+        self.write_lock = write_lock or contextlib.nullcontext()
         self.quarantine_path = 'corthrex.quarantine'
         
-        # Hard filters - Instant Trash
-        self.trash_triggers = [
-            "as an ai language model", "i cannot browse", "i do not have access", 
-            "cutoff of 2023", "openai", "cannot fulfill", "sorry, i cannot"
-        ]
+        # Hard filters - Instant Trash. Boilerplate anywhere; refusal phrases only where the
+        # model said them ("i'm sorry" from the user is conversation, not a refusal)
+        self.trash_filter = content_filter.get_filter('garbage')
+        self.response_filter = content_filter.get_filter('refusal', 'garbage')
 
-    def _is_garbage_fast(self, text):
+    def _filter_for(self, rtype):
+        return self.response_filter if rtype == eail.RT_AGENT_RESPONSE else self.trash_filter
+
+    def _is_garbage_fast(self, text, trigger=None, rtype=None):
         """
         Returns: 'TRASH', 'KEEP', or 'CHECK' (ask LLM)
+        `trigger` is a precomputed filter result (batch mode); otherwise the
+        filter for `rtype` is run here.
         """
         if not text or len(text) < 3: return 'TRASH'
-        text_lower = text.lower()
 
         # 1. CPU Check: Instant Trash
-        if any(ref in text_lower for ref in self.trash_triggers):
+        if trigger is None: trigger = self._filter_for(rtype).search(text)
+        if trigger:
             return 'TRASH'
 
         # 2. CPU Check: Instant Keep (Long + Clean)
@@ -72,14 +83,36 @@ class MemDoctor:
         except:
             return False 
 
-    def _extract_text(self, mem, offset):
-        try:
-            payload = mem.reassemble_payload(offset)
-            if not payload: return ""
-            return eail.extract_text_fast(payload)
-        except: return ""
+    def _triage(self, batch, texts, triggers, keep, trash):
+        llm_checks = 0
+        for rec in batch:
+            # Always keep system messages; ingested events are data, not chat
+            if rec['agent_id'] == 9999 or rec['type'] in (eail.RT_SYS_DIAGNOSTIC, eail.RT_EVENT):
+                keep.append(rec); continue
+
+            # Skip continuations
+            if rec['type'] == eail.RT_CONTINUATION: continue
+
+            text = texts[rec['offset']]
+
+            # FAST CHECK
+            verdict = self._is_garbage_fast(text, triggers[rec['offset']] or '', rec['type'])
+
+            if verdict == 'TRASH':
+                trash.append(rec)
+            elif verdict == 'KEEP':
+                keep.append(rec)
+            else:
+                # Only use GPU for the tricky ones
+                llm_checks += 1
+                if self._ask_llm_is_garbage(text):
+                    trash.append(rec)
+                else:
+                    keep.append(rec)
+        return llm_checks
 
     def start_cleaning_cycle(self):
+        """Returns a summary dict (None if the cycle could not start)."""
         print("\n" + "="*60)
         print(" CORTHREX MEMORY DOCTOR (TURBO)")
         print("="*60)
@@ -89,17 +122,17 @@ class MemDoctor:
             return
 
         # 1. SAFETY BACKUP
-        backup_path = f"{self.mem_path}.{int(time.time())}.bak"
         try:
-            shutil.copy2(self.mem_path, backup_path)
-            print(f"[SAFETY] Backup created: {os.path.basename(backup_path)}")
+            backup = mem_backup.IncrementalBackup(self.mem_path)
+            backup.sync(log=lambda msg: print(msg.replace("[BACKUP]", "[SAFETY]")))
         except Exception as e:
             print(f"[FATAL] Could not create backup: {e}")
             return
 
         mem = eail.CorthrexMem(self.mem_path)
-        all_records = list(mem.scan_fast())
+        all_records = [rec.to_dict() for rec in mem.scan_fast()]  # detached: the file is replaced below
         total = len(all_records)
+        scanned_to = all_records[-1]['offset'] + mem.block_size if all_records else eail.HEADER_SIZE
         
         print(f"[INFO] Scanning {total} neural blocks...")
         
@@ -109,33 +142,21 @@ class MemDoctor:
 
         # Scan loop
         start_time = time.time()
-        for i, rec in enumerate(all_records):
-            if i % 500 == 0: 
-                print(f"\r -> Analyzed {i}/{total} (LLM Calls: {llm_checks})...", end="")
-
-            # Always keep system messages
-            if rec['agent_id'] == 9999 or rec['type'] == eail.RT_SYS_DIAGNOSTIC:
-                keep.append(rec); continue
-
-            # Skip continuations
-            if rec['type'] == eail.RT_CONTINUATION: continue
-
-            text = self._extract_text(mem, rec['offset'])
-            
-            # FAST CHECK
-            verdict = self._is_garbage_fast(text)
-            
-            if verdict == 'TRASH':
-                trash.append(rec)
-            elif verdict == 'KEEP':
-                keep.append(rec)
-            else:
-                # Only use GPU for the tricky ones
-                llm_checks += 1
-                if self._ask_llm_is_garbage(text):
-                    trash.append(rec)
-                else:
-                    keep.append(rec)
+        for lo in range(0, total, SCAN_BATCH):
+            print(f"\r -> Analyzed {lo}/{total} (LLM Calls: {llm_checks})...", end="")
+            batch = all_records[lo:lo + SCAN_BATCH]
+            screened = [rec for rec in batch if not (rec['agent_id'] == 9999 or rec['type'] in
+                                                     (eail.RT_SYS_DIAGNOSTIC, eail.RT_EVENT, eail.RT_CONTINUATION))]
+            texts, responses = {}, {}
+            for rec, text in zip(screened, mem.get_texts([rec['offset'] for rec in screened])):  # one batch decode
+                group = responses if rec['type'] == eail.RT_AGENT_RESPONSE else texts
+                group[rec['offset']] = text
+            mem_jobs.pace(lo, total, len(batch) * mem.block_size)
+            # One filter pass per record group over the whole batch
+            triggers = dict(zip(texts, self.trash_filter.scan(texts.values())))
+            triggers.update(zip(responses, self.response_filter.scan(responses.values())))
+            texts.update(responses)
+            llm_checks += self._triage(batch, texts, triggers, keep, trash)
 
         duration = time.time() - start_time
         print(f"\r -> Analyzed {total}/{total}. Done in {duration:.2f}s.      ")
@@ -146,36 +167,49 @@ class MemDoctor:
         print(f" - Healthy Records: {len(keep)}")
         print(f" - Corrupt/Trash:   {trash_count}")
         print(f" - LLM Validations: {llm_checks} (Optimized)")
+        report = {'scanned': total, 'kept': len(keep), 'trash': trash_count, 'llm_checks': llm_checks,
+                  'aborted': False, 'rewritten': False}
 
         if trash_count == 0:
             print("\n[OK] System is clean.")
-            return
+            return report
 
         # Safety Valve
         ratio = trash_count / total
         if ratio > SAFE_DELETE_THRESHOLD:
             print(f"\n[🚨 ABORT] Safety Triggered! Attempted to delete {ratio*100:.1f}% of memory.")
-            return
+            report['aborted'] = True
+            return report
 
         print("\n[ACTION] performing surgery...")
         
         # Rewrite Logic
         temp_path = self.mem_path + ".clean"
+        bs = mem.block_size
         try:
-            with open(temp_path, 'wb') as f_out:
-                f_out.write(eail.HEADER_STRUCT.pack(eail.FILE_TAG, 1, eail.BLOCK_SIZE, 0))
-                with open(self.mem_path, 'rb') as f_in:
+            with self.write_lock:
+                with open(temp_path, 'wb') as f_out, open(self.mem_path, 'rb') as f_in:
+                    # Records appended since the scan are carried over unscreened; the next cycle sees them
+                    f_in.seek(0, os.SEEK_END)
+                    late = max(0, f_in.tell() - scanned_to) // bs
+                    f_out.write(eail.pack_header(bs, tail=eail.HEADER_SIZE + (len(keep) + late) * bs))
                     for rec in keep:
                         f_in.seek(rec['offset'])
-                        data = f_in.read(eail.BLOCK_SIZE)
+                        data = f_in.read(bs)
                         f_out.write(data)
-            
-            os.replace(temp_path, self.mem_path)
+                    f_in.seek(scanned_to); f_out.write(f_in.read(late * bs))
+                    f_out.flush(); os.fsync(f_out.fileno())
+                os.replace(temp_path, self.mem_path)
+            # Outside the lock: re-hashing the file is paced. Turns appended meanwhile are legitimate and covered too
+            entry = mem_merkle.checkpoint_rewrite(self.mem_path)
+            report['rewritten'] = True
             print(f"[SUCCESS] Removed {trash_count} blocks. Optimization complete.")
+            if entry: print(f"[OK] Trusted root {entry['root'][:16]}… at {entry['size']} blocks")
             
         except Exception as e:
             print(f"[ERROR] Rebuild failed: {e}")
             if os.path.exists(temp_path): os.remove(temp_path)
+        return report
 
 if __name__ == "__main__":
     doc = MemDoctor()
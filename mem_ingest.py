@@ -0,0 +1,274 @@
+# mem_ingest.py
+# Corthrex Bulk Ingestion
+# Usage: python mem_ingest.py events.jsonl [memory_file] [--text-field text] [--ts-field ts]
+#        python mem_ingest.py readings.csv [memory_file] --ts-field time --workers 8
+#
+# Loads external event streams (sensor readings, ledger lines, logs) in bulk.
+# append_with_continuation pays a SimHash, a CRC and an fsync per record; here
+#   1. the reader turns rows into payloads and, since a payload's length fixes
+#      its block count, hands out file offsets up front;
+#   2. worker processes SimHash, pack and CRC whole chunks of records into one
+#      contiguous buffer, with the Merkle leaf hashes alongside;
+#   3. the writer appends the buffers in order: one write, one fsync and one
+#      tail-slot update per BATCH_BYTES. Existing sidecars (.simidx, .merkle)
+#      are fed in the same pass.
+# A crash loses at most the batch being written: the tail slot only ever names
+# fsynced blocks, and the sidecars are only fed after the fsync.
+#
+# Offsets are planned from the tail at the start, but the tail is re-read
+# before every write. Records another handle appended meanwhile are kept:
+# the batch is moved past them (continuation links re-pointed, CRCs redone)
+# and later batches follow. Pass the live CorthrexMem (mem=) to make
+# in-process writers wait on its write_lock instead.
+#
+# Rows become RT_EVENT records. A dict row is stored as its JSON (the raw line
+# for JSONL), a str row as text, and a bytes row as an already-encoded EAIL
+# payload. Header timestamps must not go backwards (queries seek on them), so
+# an out-of-order row is stamped with the previous time. Its own time stays in
+# the payload.
+
+import os
+import sys
+import csv
+import json
+import time
+import hashlib
+import itertools
+import argparse
+import datetime
+import multiprocessing
+from collections import deque
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import eail
+import mem_jobs
+import mem_merkle
+from simhash_index import SimHashIndex, INDEX_SUFFIX
+
+# --- Configuration ---
+MEMORY_FILE = "corthrex.cxm"
+INGEST_AGENT_ID = 9100          # distinct from chat (0/1), rollups (9000) and doctrine (9999)
+CHUNK_RECORDS = 2000            # records per worker task
+BATCH_BYTES = 16 * 1024 * 1024  # bytes per write + fsync
+MAX_INFLIGHT_PER_WORKER = 2     # chunks queued ahead per worker; bounds memory on huge inputs
+
+Item = Tuple[int, int, bytes, str, int, int]  # rtype, agent_id, payload, text, timestamp_ns, head_offset
+
+# ---------------------------
+# Sources
+# ---------------------------
+def read_jsonl(path: str) -> Iterator[Tuple[Any, Optional[bytes]]]:
+    """(row, raw line) pairs; undecodable lines come through as (None, line)."""
+    with open(path, 'rb') as f:
+        for line in f:
+            line = line.strip()
+            if not line: continue
+            try: yield json.loads(line), line
+            except ValueError: yield None, line
+
+def read_csv(path: str) -> Iterator[Tuple[Any, Optional[bytes]]]:
+    with open(path, 'r', newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f): yield row, None
+
+def open_source(path: str, fmt: Optional[str] = None) -> Iterator[Tuple[Any, Optional[bytes]]]:
+    fmt = fmt or ('csv' if path.lower().endswith('.csv') else 'jsonl')
+    if fmt not in ('jsonl', 'csv'): raise ValueError(f"unknown format {fmt!r}")
+    return read_csv(path) if fmt == 'csv' else read_jsonl(path)
+
+def parse_timestamp(value) -> Optional[int]:
+    """Epoch seconds, ms, us or ns (told apart by magnitude), or an ISO-8601 string, as ns."""
+    if value is None or value == '': return None
+    if isinstance(value, str):
+        try: value = float(value)
+        except ValueError:
+            try: dt = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+            except ValueError: return None
+            if dt.tzinfo is None: dt = dt.astimezone()  # naive: local time, like the rest of the app
+            return int(dt.timestamp() * 10**9)
+    if isinstance(value, bool) or not isinstance(value, (int, float)): return None
+    for limit, scale in ((1e11, 10**9), (1e14, 10**6), (1e17, 10**3)):
+        if abs(value) < limit: return int(value * scale)
+    return int(value)
+
+def _payload(value: bytes) -> bytes:
+    return eail.ops(eail.op_req(), eail.op_push_val(eail.AT_BYTES, value))
+
+def encode_row(row, raw: Optional[bytes] = None, text_field: Optional[str] = 'text',
+               ts_field: Optional[str] = None) -> Tuple[bytes, str, Optional[int]]:
+    """(payload, text to SimHash, timestamp_ns or None) for one input row."""
+    if isinstance(row, (bytes, bytearray)):
+        return bytes(row), eail.extract_text_fast(row), None
+    if isinstance(row, str):
+        return _payload(row.encode('utf-8')), row, None
+    if not isinstance(row, dict): raise TypeError(f"rows must be dict, str or bytes, got {type(row).__name__}")
+    blob = raw if raw is not None else json.dumps(row, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    text = row.get(text_field) if text_field else None
+    return (_payload(blob), text if isinstance(text, str) else blob.decode('utf-8', 'ignore'),
+            parse_timestamp(row.get(ts_field)) if ts_field else None)
+
+def relocate(buf: bytes, block_size: int, shift: int) -> bytes:
+    """Packed blocks moved `shift` bytes along the file: continuation links follow their heads."""
+    out = bytearray(buf)
+    for pos in range(0, len(out), block_size):
+        if out[pos + 1] != eail.RT_CONTINUATION: continue
+        eail._U64.pack_into(out, pos + 12, eail._U64.unpack_from(out, pos + 12)[0] + shift)
+        eail._U32.pack_into(out, pos + block_size - 4, eail.crc32c(out[pos + 1:pos + block_size - 4]))
+    return bytes(out)
+
+def blocks_for(payload_len: int, block_size: int) -> int:
+    cap = block_size - eail.RECORD_OVERHEAD
+    return 1 if payload_len <= cap else 1 + -(-(payload_len - cap) // (cap - 2))
+
+# ---------------------------
+# Worker stage
+# ---------------------------
+def _pack_chunk(block_size: int, want_leaves: bool, items: List[Item]):
+    """SimHash + pack + CRC for a run of consecutive records. Runs in a worker process."""
+    buf, entries, leaves = [], [], []
+    word = eail._WORD_RE.search
+    for rtype, agent_id, payload, text, ts, head in items:
+        # Text without words: a payload digest instead of simhash128's per-record random fill
+        semhash = eail.simhash128(text) if word(text) else hashlib.blake2b(payload, digest_size=16).digest()
+        blocks = eail.pack_chain(agent_id, rtype, payload, head, semhash, 0, ts, block_size)
+        buf.extend(blocks)
+        entries.append((head, semhash))
+        if want_leaves: leaves.extend(mem_merkle.leaf_hash(b) for b in blocks)
+    return b''.join(buf), entries, leaves
+
+# ---------------------------
+# Pipeline
+# ---------------------------
+class BulkIngest:
+    """
+    Bulk writer for one memory file. Holds the handle's write_lock for the
+    whole load; that only stops writers sharing the handle (pass the app's
+    mem=). Appends from other handles are detected before each write and the
+    batch is moved past them.
+    """
+    def __init__(self, mem_path: str = MEMORY_FILE, block_size: Optional[int] = None, workers: Optional[int] = None,
+                 sidecars: Optional[Sequence[str]] = None, log=print, mem: Optional[eail.CorthrexMem] = None):
+        self.mem = mem or eail.CorthrexMem(mem_path, block_size=block_size)
+        self.workers = workers if workers is not None else (os.cpu_count() or 1)
+        if sidecars is None:  # keep whatever sidecars the file already has up to date
+            sidecars = [name for name, path in (('simhash', self.mem.path + INDEX_SUFFIX),
+                                                ('merkle', self.mem.path + mem_merkle.MERKLE_SUFFIX)) if os.path.exists(path)]
+        self.sidecars = tuple(sidecars)
+        self.log = log
+
+    def _items(self, rows: Iterable, rtype: int, agent_id: int, text_field, ts_field, stats) -> Iterator[List[Item]]:
+        bs = self.mem.block_size
+        offset = self.mem.get_tail_offset()
+        last = self.mem.query().newest_first().select('timestamp').first()
+        last_ts = last['timestamp'] if last else 0
+        chunk: List[Item] = []
+        for entry in rows:
+            row, raw = entry if isinstance(entry, tuple) else (entry, None)
+            if row is None:
+                stats['skipped'] += 1; continue
+            try: payload, text, ts = encode_row(row, raw, text_field, ts_field)
+            except (TypeError, ValueError):
+                stats['skipped'] += 1; continue
+            if ts is None: ts = max(time.time_ns(), last_ts)
+            elif ts < last_ts: ts = last_ts; stats['clamped'] += 1
+            last_ts = ts
+            chunk.append((rtype, agent_id, payload, text, ts, offset))
+            offset += blocks_for(len(payload), bs) * bs
+            if len(chunk) >= CHUNK_RECORDS: yield chunk; chunk = []
+        if chunk: yield chunk
+
+    def run(self, rows: Iterable, rtype: int = eail.RT_EVENT, agent_id: int = INGEST_AGENT_ID,
+            text_field: Optional[str] = 'text', ts_field: Optional[str] = None) -> Dict[str, Any]:
+        """
+        rows: dicts, strs or bytes, or (row, raw_line) pairs as from open_source().
+        Returns counts and throughput.
+        """
+        mem, bs = self.mem, self.mem.block_size
+        stats = {'records': 0, 'blocks': 0, 'bytes': 0, 'batches': 0, 'skipped': 0, 'clamped': 0, 'moved': 0}
+        start = time.perf_counter()
+        with mem.write_lock:
+            index = merkle = None
+            if 'simhash' in self.sidecars: index = SimHashIndex(mem); index.sync()
+            if 'merkle' in self.sidecars: merkle = mem_merkle.MerkleLog(mem); merkle.sync()
+            tail = mem.get_tail_offset()
+            pending: List[bytes] = []; entries: List = []; leaves: List[bytes] = []
+            size = shift = 0  # shift: how far the plan has been pushed back by other writers' appends
+
+            def flush():
+                nonlocal tail, size, shift
+                if not pending: return
+                actual = mem.get_tail_offset()
+                if actual != tail:  # another handle appended: write after it, sidecars take its records first
+                    if actual < tail: raise RuntimeError(f"{mem.path} shrank during ingest (tail {tail} -> {actual})")
+                    shift += actual - tail; tail = actual; stats['moved'] += 1
+                    if index is not None: index.sync()
+                    if merkle is not None: merkle.sync()
+                if shift:
+                    pending[:] = [relocate(buf, bs, shift) for buf in pending]
+                    entries[:] = [(head + shift, semhash) for head, semhash in entries]
+                    if merkle is not None:
+                        leaves[:] = [mem_merkle.leaf_hash(buf[i:i + bs]) for buf in pending for i in range(0, len(buf), bs)]
+                mem._append_blocks(pending, tail)
+                tail += size
+                if index is not None: index.add(entries)  # sidecars only ever name fsynced records
+                if merkle is not None: merkle.add_leaves(leaves)
+                stats['bytes'] += size; stats['batches'] += 1
+                pending.clear(); entries.clear(); leaves.clear(); size = 0
+                mem_jobs.pace(nbytes=BATCH_BYTES, message=f"{stats['records']:,} records")
+
+            def take(result):
+                nonlocal size
+                buf, ents, lvs = result
+                pending.append(buf); entries.extend(ents); leaves.extend(lvs); size += len(buf)
+                stats['records'] += len(ents); stats['blocks'] += len(buf) // bs
+                if size >= BATCH_BYTES: flush()
+
+            chunks = self._items(rows, rtype, agent_id, text_field, ts_field, stats)
+            first = next(chunks, None)
+            # One short chunk (or one CPU): pack inline, a pool would cost more to start than it saves
+            if first is not None and (self.workers <= 1 or len(first) < CHUNK_RECORDS):
+                take(_pack_chunk(bs, merkle is not None, first))
+                for chunk in chunks: take(_pack_chunk(bs, merkle is not None, chunk))
+            elif first is not None:
+                with multiprocessing.Pool(self.workers) as pool:
+                    inflight = deque()
+                    for chunk in itertools.chain((first,), chunks):
+                        inflight.append(pool.apply_async(_pack_chunk, (bs, merkle is not None, chunk)))
+                        if len(inflight) >= self.workers * MAX_INFLIGHT_PER_WORKER: take(inflight.popleft().get())
+                    while inflight: take(inflight.popleft().get())
+            flush()
+            if index is not None and stats['records']: index.save()  # next open loads the buckets in bulk
+
+        stats['seconds'] = round(time.perf_counter() - start, 3)
+        stats['records_per_sec'] = int(stats['records'] / stats['seconds']) if stats['seconds'] else stats['records']
+        self.log(f"[INGEST] {stats['records']:,} records -> {stats['blocks']:,} blocks in {stats['seconds']}s "
+                 f"({stats['records_per_sec']:,}/s, {stats['batches']} fsyncs)")
+        if stats['skipped']: self.log(f"[INGEST] Skipped {stats['skipped']:,} rows that could not be read")
+        if stats['moved']: self.log(f"[INGEST] Another writer appended during the load ({stats['moved']}x); the batches after it were moved past its records")
+        if stats['clamped']: self.log(f"[INGEST] {stats['clamped']:,} rows were older than the record before them; stamped with its time")
+        return stats
+
+def ingest(mem_path: str, rows: Iterable, **kwargs) -> Dict[str, Any]:
+    """One-call API: ingest(path, rows, text_field='msg', ts_field='ts', workers=4)."""
+    options = {k: kwargs.pop(k) for k in ('block_size', 'workers', 'sidecars', 'log', 'mem') if k in kwargs}
+    return BulkIngest(mem_path, **options).run(rows, **kwargs)
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-load JSONL or CSV events into a .cxm memory file")
+    parser.add_argument('source')
+    parser.add_argument('memory', nargs='?', default=MEMORY_FILE)
+    parser.add_argument('--format', choices=('jsonl', 'csv'), default=None, help="default: from the file extension")
+    parser.add_argument('--text-field', default='text', help="field to SimHash (default: the whole row)")
+    parser.add_argument('--ts-field', default=None, help="event time field (epoch s/ms/us/ns or ISO-8601)")
+    parser.add_argument('--type', type=int, default=eail.RT_EVENT)
+    parser.add_argument('--agent', type=int, default=INGEST_AGENT_ID)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--block-size', type=int, choices=eail.BLOCK_SIZES, default=None, help="for a new file")
+    parser.add_argument('--index', action='append', choices=('simhash', 'merkle'), default=None,
+                        help="sidecars to build (default: the ones that already exist)")
+    args = parser.parse_args()
+    BulkIngest(args.memory, args.block_size, args.workers, args.index).run(
+        open_source(args.source, args.format), args.type, args.agent, args.text_field, args.ts_field)
+
+if __name__ == "__main__":
+    main()
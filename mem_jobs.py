@@ -0,0 +1,280 @@
+# mem_jobs.py
+# Corthrex Maintenance Jobs
+# One background worker for benchmarks, audits, doctor passes, index rebuilds
+# and backups, so none of them runs inside a request handler.
+#
+# Jobs run one at a time in submission order. The long loops in the
+# maintenance modules call pace() between units of work. Inside a job that is
+# where progress is reported, cancellation is honoured, the I/O budget is
+# enforced and the job steps aside while a chat request is in flight. Outside
+# a job pace() returns at once, so the same modules still run at full speed
+# from the command line.
+#
+# Jobs that rewrite the memory file take the live handle's write_lock only
+# for the final catch-up and swap (see MemAuditor and MemDoctor).
+
+import os
+import sys
+import json
+import time
+import logging
+import itertools
+import threading
+import contextlib
+from collections import OrderedDict, deque
+from typing import Any, Callable, Dict, List, Optional
+
+# --- Configuration ---
+IO_RATE_BYTES = 32 * 1024 * 1024   # background read/write budget, bytes per second
+FOREGROUND_MAX_WAIT = 30.0         # longest a job pauses for one stretch of in-flight requests
+JOB_HISTORY = 50                   # finished jobs kept for /api/jobs
+JOB_LOG_LINES = 200
+JOB_NICE = 10                      # worker thread niceness (Linux)
+
+class JobCancelled(Exception):
+    pass
+
+class Throttle:
+    """Token bucket: take(n) sleeps just long enough to keep the average under `rate` bytes/s."""
+    def __init__(self, rate: float = IO_RATE_BYTES):
+        self.rate = rate
+        self.burst = rate / 4  # a quarter second of slack
+        self._tokens = self.burst
+        self._stamp = time.monotonic()
+
+    def take(self, nbytes: int):
+        if self.rate <= 0 or nbytes <= 0: return
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate) - nbytes
+        self._stamp = now
+        if self._tokens < 0: time.sleep(-self._tokens / self.rate)
+
+class Job:
+    __slots__ = ('id', 'kind', 'params', 'status', 'progress', 'message', 'result', 'error', 'log_lines',
+                 'scheduled', 'created', 'started', 'finished', '_cancel', '_waited_epoch')
+
+    def __init__(self, job_id: int, kind: str, params: Dict[str, Any], scheduled: bool = False):
+        self.id, self.kind, self.params, self.scheduled = job_id, kind, params, scheduled
+        self.status = 'queued'
+        self.progress = 0.0
+        self.message = ''
+        self.result = self.error = None
+        self.log_lines = deque(maxlen=JOB_LOG_LINES)
+        self.created, self.started, self.finished = time.time(), None, None
+        self._cancel = threading.Event()
+        self._waited_epoch = -1
+
+    @property
+    def done(self) -> bool: return self.status in ('done', 'failed', 'cancelled')
+
+    def log(self, message: str):
+        self.log_lines.append(message); self.message = message
+
+    def to_dict(self, log: bool = False) -> Dict[str, Any]:
+        d = {'id': self.id, 'kind': self.kind, 'params': self.params, 'status': self.status,
+             'progress': round(self.progress, 3), 'message': self.message, 'result': self.result,
+             'error': self.error, 'scheduled': self.scheduled,
+             'created': self.created, 'started': self.started, 'finished': self.finished}
+        if log: d['log'] = list(self.log_lines)
+        return d
+
+_local = threading.local()
+
+def current_job() -> Optional[Job]:
+    ctx = getattr(_local, 'ctx', None)
+    return ctx[0] if ctx else None
+
+def pace(done: Optional[int] = None, total: Optional[int] = None, nbytes: int = 0, message: Optional[str] = None):
+    """Cooperative yield point for maintenance loops; a no-op outside a job."""
+    ctx = getattr(_local, 'ctx', None)
+    if ctx is not None: ctx[1]._pace(ctx[0], done, total, nbytes, message)
+
+class JobScheduler:
+    def __init__(self, io_rate: float = IO_RATE_BYTES, state_path: Optional[str] = None):
+        self.throttle = Throttle(io_rate)
+        self.state_path = state_path  # last run per scheduled kind, so schedules survive restarts
+        self._kinds: Dict[str, Callable[..., Any]] = {}
+        self._params: Dict[str, Dict[str, type]] = {}  # kind -> accepted parameter names and types
+        self._jobs: 'OrderedDict[int, Job]' = OrderedDict()
+        self._queue: deque = deque()
+        self._schedule: Dict[str, Dict[str, Any]] = {}
+        self._ids = itertools.count(1)
+        self._cond = threading.Condition()
+        self._foreground = 0
+        self._fg_epoch = 0
+        self._thread = None
+        self._stop = False
+
+    # ---------------------------
+    # Registration / submission
+    # ---------------------------
+    def register(self, kind: str, fn: Callable[..., Any], params: Optional[Dict[str, type]] = None):
+        """
+        fn(job, **params) runs on the worker; its return value (JSON-able) becomes job.result.
+        `params` names the parameters a caller may pass and their types, e.g. {'full': bool}.
+        """
+        self._kinds[kind] = fn
+        self._params[kind] = dict(params or {})
+
+    @property
+    def kinds(self) -> List[str]: return sorted(self._kinds)
+
+    def _check(self, kind: str, params: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """The validated parameters of a request; ValueError for anything the kind does not accept."""
+        if kind not in self._kinds: raise ValueError(f"unknown job kind {kind!r}, have {self.kinds}")
+        if params is None: return {}
+        if not isinstance(params, dict): raise ValueError("job params must be an object")
+        spec = self._params[kind]
+        for name, value in params.items():
+            if name not in spec: raise ValueError(f"job kind {kind!r} takes no parameter {name!r}, accepts {sorted(spec)}")
+            if type(value) is not spec[name]: raise ValueError(f"parameter {name!r} of {kind!r} must be {spec[name].__name__}")
+        return dict(params)
+
+    def submit(self, kind: str, params: Optional[Dict[str, Any]] = None, scheduled: bool = False) -> Job:
+        """Queues a job. An identical job that is already queued or running is returned instead."""
+        params = self._check(kind, params)
+        with self._cond:
+            for job in self._jobs.values():
+                if job.kind == kind and job.params == params and not job.done: return job
+            job = Job(next(self._ids), kind, params, scheduled)
+            self._jobs[job.id] = job
+            self._queue.append(job)
+            self._trim()
+            self._cond.notify_all()
+        self.start()
+        return job
+
+    def every(self, kind: str, seconds: float, params: Optional[Dict[str, Any]] = None):
+        """Runs `kind` every `seconds`, counted from its last run (persisted in state_path)."""
+        params = self._check(kind, params)
+        state = self._load_state()
+        if kind not in state: state[kind] = time.time(); self._save_state(state)  # first run one interval from now
+        with self._cond:
+            self._schedule[kind] = {'every': seconds, 'params': params, 'next': state[kind] + seconds}
+            self._cond.notify_all()
+        self.start()
+
+    def get(self, job_id: int) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._cond: return [job.to_dict() for job in reversed(self._jobs.values())]
+
+    def schedule(self) -> Dict[str, Dict[str, Any]]:
+        with self._cond: return {kind: {'every': s['every'], 'next_run': s['next']} for kind, s in self._schedule.items()}
+
+    def cancel(self, job_id: int) -> Optional[Job]:
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job.done: return job
+            if job.status == 'queued':
+                self._queue.remove(job); job.status = 'cancelled'; job.finished = time.time()
+            else:
+                job._cancel.set()  # takes effect at the job's next pace()
+            self._cond.notify_all()
+            return job
+
+    def wait(self, job: Job, timeout: Optional[float] = None) -> bool:
+        with self._cond: return self._cond.wait_for(lambda: job.done, timeout)
+
+    @contextlib.contextmanager
+    def foreground(self):
+        """Wrap latency-sensitive work (a chat request); running jobs pause until it finishes."""
+        with self._cond:
+            if not self._foreground: self._fg_epoch += 1
+            self._foreground += 1
+        try: yield
+        finally:
+            with self._cond: self._foreground -= 1; self._cond.notify_all()
+
+    # ---------------------------
+    # Worker
+    # ---------------------------
+    def start(self):
+        with self._cond:
+            if self._thread and self._thread.is_alive(): return
+            self._stop = False
+            self._thread = threading.Thread(target=self._run, name="corthrex-jobs", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        with self._cond:
+            self._stop = True
+            for job in self._jobs.values():
+                if job.status == 'running': job._cancel.set()
+            self._cond.notify_all()
+        if self._thread: self._thread.join(timeout)
+
+    def _run(self):
+        if sys.platform.startswith('linux'):
+            try: os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), JOB_NICE)  # this thread only
+            except (AttributeError, OSError): pass
+        while True:
+            with self._cond:
+                while True:
+                    if self._stop: return
+                    wait = self._enqueue_due()
+                    if self._queue: break
+                    self._cond.wait(wait)
+                job = self._queue.popleft()
+                job.status, job.started = 'running', time.time()
+            self._execute(job)
+
+    def _enqueue_due(self) -> Optional[float]:
+        """Queues scheduled jobs that are due. Returns seconds until the next one (None if nothing is scheduled)."""
+        now, wait = time.time(), None
+        for kind, s in self._schedule.items():
+            if s['next'] <= now:
+                self.submit(kind, s['params'], scheduled=True)
+                s['next'] = now + s['every']
+            wait = s['next'] - now if wait is None else min(wait, s['next'] - now)
+        return wait
+
+    def _execute(self, job: Job):
+        _local.ctx = (job, self)
+        try:
+            job.result = self._kinds[job.kind](job, **job.params)
+            job.status, job.progress = 'done', 1.0
+        except JobCancelled:
+            job.status = 'cancelled'
+        except Exception as e:
+            job.status, job.error = 'failed', f"{type(e).__name__}: {e}"
+            logging.exception(f"[Jobs] #{job.id} {job.kind} failed")
+        finally:
+            _local.ctx = None
+            job.finished = time.time()
+            with self._cond: self._cond.notify_all()
+        logging.info(f"[Jobs] #{job.id} {job.kind} {job.status} in {job.finished - job.started:.2f}s")
+        if job.kind in self._schedule:
+            state = self._load_state(); state[job.kind] = job.finished; self._save_state(state)
+
+    def _pace(self, job: Job, done, total, nbytes: int, message):
+        if job._cancel.is_set(): raise JobCancelled()
+        if total: job.progress = min(1.0, done / total)
+        if message: job.log(message)
+        if nbytes: self.throttle.take(nbytes)
+        if self._foreground and job._waited_epoch != self._fg_epoch:
+            with self._cond:
+                # Once per stretch of foreground activity: a steady stream of requests slows a job, never starves it
+                job._waited_epoch = self._fg_epoch
+                self._cond.wait_for(lambda: not self._foreground or job._cancel.is_set(), FOREGROUND_MAX_WAIT)
+            if job._cancel.is_set(): raise JobCancelled()
+
+    def _trim(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.done]
+        for job_id in finished[:max(0, len(finished) - JOB_HISTORY)]: del self._jobs[job_id]
+
+    # ---------------------------
+    # Schedule state
+    # ---------------------------
+    def _load_state(self) -> Dict[str, float]:
+        if not self.state_path or not os.path.exists(self.state_path): return {}
+        try:
+            with open(self.state_path, 'r') as f: return json.load(f)
+        except (OSError, ValueError): return {}
+
+    def _save_state(self, state: Dict[str, float]):
+        if not self.state_path: return
+        tmp = self.state_path + '.tmp'
+        with open(tmp, 'w') as f: json.dump(state, f)
+        os.replace(tmp, self.state_path)
@@ -0,0 +1,332 @@
+# mem_merkle.py
+# Corthrex Merkle Log (tamper evidence)
+# Usage: python mem_merkle.py [memory_file]                 sync + checkpoint a root
+#        python mem_merkle.py [memory_file] --verify        check new blocks, spot-check old ones
+#        python mem_merkle.py [memory_file] --verify --full re-hash every block against the trusted root
+#        python mem_merkle.py [memory_file] --prove OFFSET  inclusion proof for one record
+#
+# A hash tree over every committed block, kept beside the memory file in
+# <memory>.merkle/. Hashing follows RFC 6962 / 9162 (Certificate Transparency):
+#   leaf  = sha256(0x00 || block)      node = sha256(0x01 || left || right)
+# so proofs can be checked with any CT-style verifier.
+#
+# Sidecar layout (append-only, a cache of the .cxm except for roots.jsonl):
+#   level00.bin, level01.bin, ...   32-byte hashes of every complete, aligned
+#                                   subtree of 2^level leaves, in order
+#   roots.jsonl                     checkpointed roots: size, root, ts, sig
+# Roots are signed with HMAC-SHA256 when CORTHREX_MERKLE_KEY is set. Without a
+# key they are "pinned": trusted as written, so copy them somewhere the memory
+# file's owner cannot edit (or pass one back in with --root SIZE:HEX).
+#
+# Any root of any size is computable from the level files in O(log n) reads,
+# which is what keeps proofs and verification away from full rescans.
+
+import os
+import sys
+import json
+import hmac
+import time
+import random
+import hashlib
+import argparse
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import eail
+import mem_jobs
+
+# --- Configuration ---
+MEMORY_FILE = "corthrex.cxm"
+MERKLE_SUFFIX = ".merkle"
+ROOTS_FILE = "roots.jsonl"
+KEY_ENV = "CORTHREX_MERKLE_KEY"
+SPOT_CHECKS = 16          # old records re-proved against the trusted root on each verify
+READ_CHUNK = 4 * 1024 * 1024
+
+HASH_SIZE = 32
+EMPTY_ROOT = hashlib.sha256(b'').digest()
+
+def leaf_hash(block) -> bytes:
+    return hashlib.sha256(b'\x00' + bytes(block)).digest()
+
+def node_hash(left: bytes, right: bytes) -> bytes:
+    return hashlib.sha256(b'\x01' + left + right).digest()
+
+def _split(n: int) -> int:
+    """Largest power of two strictly below n (n >= 2)."""
+    return 1 << ((n - 1).bit_length() - 1)
+
+def verify_inclusion(leaf: bytes, index: int, size: int, path: List[bytes], root: bytes) -> bool:
+    """RFC 9162 section 2.1.3.2."""
+    if index >= size: return False
+    fn, sn, r = index, size - 1, leaf
+    for p in path:
+        if sn == 0: return False
+        if fn & 1 or fn == sn:
+            r = node_hash(p, r)
+            if not fn & 1:
+                while fn and not fn & 1: fn >>= 1; sn >>= 1
+        else:
+            r = node_hash(r, p)
+        fn >>= 1; sn >>= 1
+    return sn == 0 and r == root
+
+class MerkleLog:
+    def __init__(self, mem: eail.CorthrexMem, path: Optional[str] = None, key: Optional[bytes] = None):
+        self.mem = mem
+        self.dir = path or mem.path + MERKLE_SUFFIX
+        self.key = key if key is not None else (os.environ.get(KEY_ENV) or '').encode() or None
+        self._counts: List[int] = []           # nodes stored per level
+        self._open: Dict[int, bytes] = {}      # level -> last node while it still waits for a sibling
+        os.makedirs(self.dir, exist_ok=True)
+        self._load()
+
+    def __len__(self): return self._counts[0] if self._counts else 0
+
+    # ---------------------------
+    # Level files
+    # ---------------------------
+    def _level_path(self, level: int) -> str:
+        return os.path.join(self.dir, f"level{level:02d}.bin")
+
+    def _node(self, level: int, index: int) -> bytes:
+        with open(self._level_path(level), 'rb') as f:
+            f.seek(index * HASH_SIZE)
+            return f.read(HASH_SIZE)
+
+    def _load(self):
+        self._counts, self._open = [], {}
+        level = 0
+        while os.path.exists(self._level_path(level)):
+            size = os.path.getsize(self._level_path(level))
+            if size % HASH_SIZE:  # torn append: drop the partial hash
+                with open(self._level_path(level), 'r+b') as f: f.truncate(size - size % HASH_SIZE)
+            self._counts.append(size // HASH_SIZE)
+            level += 1
+        # Upper levels can lag after a crash between level writes; rebuild them from level 0
+        if any(self._counts[lvl] != self._counts[lvl - 1] // 2 for lvl in range(1, len(self._counts))):
+            self._rebuild_upper()
+        for lvl, count in enumerate(self._counts):
+            if count & 1: self._open[lvl] = self._node(lvl, count - 1)
+
+        if len(self) and not self._matches_file():
+            eail.logger.warning(f"Merkle tree {self.dir} does not match {self.mem.path} (rewritten?), rebuilding")
+            self.reset()
+
+    def _matches_file(self) -> bool:
+        n = len(self)
+        end = eail.HEADER_SIZE + n * self.mem.block_size
+        if end > self.mem.get_tail_offset(): return False
+        return leaf_hash(self._read_blocks(n - 1, 1)) == self._node(0, n - 1)
+
+    def _rebuild_upper(self):
+        leaves = self._counts[0] if self._counts else 0
+        for lvl in range(1, len(self._counts)): os.remove(self._level_path(lvl))
+        with open(self._level_path(0), 'rb') as f: hashes = [f.read(HASH_SIZE) for _ in range(leaves)]
+        os.remove(self._level_path(0))
+        self._counts, self._open = [], {}
+        self._append(hashes)
+
+    def reset(self):
+        """Drops the tree (not the roots log). Used after a legitimate rewrite such as a repair."""
+        for lvl in range(len(self._counts)): os.remove(self._level_path(lvl))
+        self._counts, self._open = [], {}
+
+    def _append(self, leaves: List[bytes]):
+        pending: Dict[int, List[bytes]] = {}
+        for node in leaves:
+            level = 0
+            while True:
+                if level == len(self._counts): self._counts.append(0)
+                pending.setdefault(level, []).append(node)
+                self._counts[level] += 1
+                if self._counts[level] & 1:
+                    self._open[level] = node; break
+                node = node_hash(self._open.pop(level), node); level += 1
+        for level in sorted(pending):  # lower levels first: a crash leaves upper levels short, never long
+            with open(self._level_path(level), 'ab') as f: f.write(b''.join(pending[level]))
+
+    def _read_blocks(self, first: int, count: int) -> bytes:
+        with open(self.mem.path, 'rb') as f:
+            f.seek(eail.HEADER_SIZE + first * self.mem.block_size)
+            return f.read(count * self.mem.block_size)
+
+    def _iter_new_blocks(self, first: int, last: int):
+        bs = self.mem.block_size
+        per_chunk = max(1, READ_CHUNK // bs)
+        for start in range(first, last, per_chunk):
+            data = self._read_blocks(start, min(per_chunk, last - start))
+            mem_jobs.pace(start - first, last - first, len(data))
+            for i in range(0, len(data), bs): yield start + i // bs, data[i:i + bs]
+
+    def _leaves(self, count: int):
+        """The first `count` stored leaf hashes, read sequentially."""
+        per_chunk = max(1, READ_CHUNK // HASH_SIZE)
+        with open(self._level_path(0), 'rb') as f:
+            for start in range(0, count, per_chunk):
+                data = f.read(min(per_chunk, count - start) * HASH_SIZE)
+                for i in range(0, len(data), HASH_SIZE): yield data[i:i + HASH_SIZE]
+
+    def add_leaves(self, leaves: List[bytes]) -> int:
+        """Appends leaf hashes of blocks a writer hashed itself (bulk ingest); they must follow the last leaf."""
+        self._append(leaves)
+        return len(leaves)
+
+    def sync(self) -> int:
+        """Hashes the committed blocks appended since the last sync. Returns leaves added."""
+        total = (self.mem.get_tail_offset() - eail.HEADER_SIZE) // self.mem.block_size
+        start = len(self)
+        if total <= start: return 0
+        self._append([leaf_hash(block) for _, block in self._iter_new_blocks(start, total)])
+        return total - start
+
+    # ---------------------------
+    # Roots and proofs
+    # ---------------------------
+    def _subtree(self, lo: int, hi: int) -> bytes:
+        n = hi - lo
+        if n & (n - 1) == 0 and lo % n == 0:
+            level = n.bit_length() - 1
+            return self._node(level, lo >> level)
+        k = _split(n)
+        return node_hash(self._subtree(lo, lo + k), self._subtree(lo + k, hi))
+
+    def root(self, size: Optional[int] = None) -> bytes:
+        size = len(self) if size is None else size
+        if size > len(self): raise ValueError(f"tree has {len(self)} leaves, asked for root of {size}")
+        return self._subtree(0, size) if size else EMPTY_ROOT
+
+    def _path(self, m: int, lo: int, hi: int) -> List[bytes]:
+        if hi - lo == 1: return []
+        k = _split(hi - lo)
+        if m < lo + k: return self._path(m, lo, lo + k) + [self._subtree(lo + k, hi)]
+        return self._path(m, lo + k, hi) + [self._subtree(lo, lo + k)]
+
+    def prove(self, offset: int, size: Optional[int] = None) -> Dict:
+        """Inclusion proof for the block at `offset` in the tree of `size` leaves (default: current)."""
+        size = len(self) if size is None else size
+        index = (offset - eail.HEADER_SIZE) // self.mem.block_size
+        if not 0 <= index < size: raise ValueError(f"offset {offset} is not covered by a tree of {size} blocks")
+        return {'offset': offset, 'index': index, 'size': size, 'root': self.root(size).hex(),
+                'leaf': self._node(0, index).hex(), 'path': [p.hex() for p in self._path(index, 0, size)]}
+
+    def check_record(self, offset: int, size: int, root: bytes) -> bool:
+        """Re-hashes the block on disk and checks it against a root through its inclusion proof."""
+        index = (offset - eail.HEADER_SIZE) // self.mem.block_size
+        block = self._read_blocks(index, 1)
+        return verify_inclusion(leaf_hash(block), index, size, self._path(index, 0, size), root)
+
+    # ---------------------------
+    # Checkpoints
+    # ---------------------------
+    def _sign(self, size: int, root_hex: str, ts: float) -> Optional[str]:
+        if not self.key: return None
+        return hmac.new(self.key, f"{size}:{root_hex}:{ts}".encode(), hashlib.sha256).hexdigest()
+
+    def checkpoint(self, note: str = "") -> Dict:
+        self.sync()
+        ts = time.time()
+        entry = {'size': len(self), 'root': self.root().hex(), 'ts': ts}
+        entry['sig'] = self._sign(entry['size'], entry['root'], ts)
+        if note: entry['note'] = note
+        with open(os.path.join(self.dir, ROOTS_FILE), 'a', encoding='utf-8') as f: f.write(json.dumps(entry) + "\n")
+        return entry
+
+    def trusted_root(self) -> Optional[Dict]:
+        """Newest checkpoint that verifies: signed ones when a key is set, any when roots are pinned."""
+        try:
+            with open(os.path.join(self.dir, ROOTS_FILE), 'r', encoding='utf-8') as f: lines = f.readlines()
+        except OSError: return None
+        for line in reversed(lines):
+            try: entry = json.loads(line)
+            except ValueError: continue
+            if not self.key: return entry
+            sig = self._sign(entry['size'], entry['root'], entry['ts'])
+            if entry.get('sig') and hmac.compare_digest(sig, entry['sig']): return entry
+        return None
+
+    def verify(self, trusted: Optional[Dict] = None, spot_checks: Optional[int] = None, full: bool = False) -> Dict:
+        """
+        Checks the file against the trusted root:
+          1. the stored tree still reproduces the trusted root (O(log n) node reads),
+          2. every block since then is re-hashed and CRC-checked (O(new data)),
+          3. a random sample of older records is re-proved from disk (O(k log n)).
+        The sample only makes an edit of old data likely to be caught, not certain.
+        full=True re-hashes every block under the trusted root against the stored
+        leaves instead (O(file), one sequential read).
+        `changed` lists offsets whose bytes differ from what was hashed.
+        """
+        trusted = trusted or self.trusted_root()
+        spot_checks = SPOT_CHECKS if spot_checks is None else spot_checks
+        report = {'trusted_size': 0, 'new_blocks': 0, 'bad_blocks': [], 'spot_checked': 0,
+                  'changed': [], 'ok': True, 'problems': []}
+        size = 0
+        if trusted:
+            size, root = trusted['size'], bytes.fromhex(trusted['root'])
+            report['trusted_size'] = size
+            if size > len(self) or self.root(size) != root:
+                report['ok'] = False
+                report['problems'].append(f"tree no longer reproduces the trusted root at {size} blocks")
+                return report
+            if full:  # the stored leaves reproduce the root (step 1), so a block matching its leaf is proved
+                checks = ((i, leaf_hash(block) == leaf) for (i, block), leaf in zip(self._iter_new_blocks(0, size), self._leaves(size)))
+            else:
+                checks = ((i, self.check_record(eail.HEADER_SIZE + i * self.mem.block_size, size, root))
+                          for i in random.sample(range(size), min(spot_checks, size)))
+            for index, ok in checks:
+                report['spot_checked'] += 1
+                if not ok:
+                    report['ok'] = False
+                    report['changed'].append(eail.HEADER_SIZE + index * self.mem.block_size)
+                    report['problems'].append(f"block {index} no longer matches the trusted root")
+
+        # Everything after the trusted size is verified against the file itself
+        bs = self.mem.block_size
+        total = (self.mem.get_tail_offset() - eail.HEADER_SIZE) // bs
+        stored = len(self)
+        for index, block in self._iter_new_blocks(size, total):
+            report['new_blocks'] += 1
+            if not eail._block_ok(block, 0, bs): report['bad_blocks'].append(eail.HEADER_SIZE + index * bs)
+            if index < stored and leaf_hash(block) != self._node(0, index):
+                report['ok'] = False
+                report['changed'].append(eail.HEADER_SIZE + index * bs)
+                report['problems'].append(f"block {index} changed after it was hashed")
+        if report['ok']: self.sync()
+        return report
+
+def checkpoint_rewrite(mem_path: str, note: str = "rewrite") -> Optional[Dict]:
+    """
+    After a sanctioned rewrite (doctor compaction, block size conversion): drops
+    the tree and checkpoints the new file, so later audits trust it instead of
+    alerting on a root it can never reproduce. No-op for files without a sidecar.
+    """
+    if not os.path.isdir(mem_path + MERKLE_SUFFIX): return None
+    log = MerkleLog(eail.CorthrexMem(mem_path))
+    log.reset()
+    return log.checkpoint(note=note)
+
+def main():
+    parser = argparse.ArgumentParser(description="Merkle tamper evidence for .cxm memory files")
+    parser.add_argument('source', nargs='?', default=MEMORY_FILE)
+    parser.add_argument('--verify', action='store_true', help="verify everything since the last trusted root")
+    parser.add_argument('--full', action='store_true', help="with --verify: re-hash every old block, not a sample")
+    parser.add_argument('--prove', type=int, metavar='OFFSET', help="print an inclusion proof for the record at OFFSET")
+    parser.add_argument('--root', metavar='SIZE:HEX', help="pinned root to trust instead of roots.jsonl")
+    args = parser.parse_args()
+
+    log = MerkleLog(eail.CorthrexMem(args.source))
+    if args.prove is not None:
+        log.sync(); print(json.dumps(log.prove(args.prove), indent=2))
+    elif args.verify:
+        trusted = None
+        if args.root:
+            size, root = args.root.split(':', 1); trusted = {'size': int(size), 'root': root}
+        report = log.verify(trusted, full=args.full)
+        print(json.dumps(report, indent=2))
+        sys.exit(0 if report['ok'] else 1)
+    else:
+        entry = log.checkpoint()
+        print(f"[MERKLE] {entry['size']} blocks, root {entry['root']} ({'signed' if entry['sig'] else 'pinned'})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+# mem_rollup.py
+# Corthrex Hierarchical Memory Rollups
+# Condenses closed ranges of chat turns into RT_SUMMARY records:
+#   level 1  session  (turns separated by less than SESSION_GAP)
+#   level 2  day      (session summaries, once the day is over)
+#   level 3  month    (day summaries, once the month is over)
+# Each summary links back to its source range, so the agent can carry whole
+# years of memory in a handful of prompt lines.
+#
+# Summary payload (EAIL):
+#   PUSH_KEY k PUSH_VAL AT_INT v BIND   for k in level, first, last, start_ts, end_ts, count
+#   PUSH_VAL AT_BYTES <summary text> END
+# first / last are the offsets of the first and last source turn when the
+# summary was written; the record's link field repeats `first`. mem_convert
+# remaps them, but a doctor or auditor compaction leaves them pointing at
+# other records, so what a summary covers is tracked by start_ts / end_ts.
+
+import re
+import time
+import logging
+import datetime
+import threading
+from typing import Callable, Dict, List, Optional
+
+import eail
+import eail_codec
+
+# --- Configuration ---
+SESSION_GAP_NS = 30 * 60 * 10**9     # silence that closes a session
+ROLLUP_INTERVAL = 300                # seconds between background passes
+ROLLUP_AGENT_ID = 9000               # distinct from 9999, which marks doctrine
+SUMMARY_CHARS = {1: 600, 2: 800, 3: 1000}
+SUMMARIZER_INPUT_CHARS = 12000
+
+LEVEL_SESSION = 1; LEVEL_DAY = 2; LEVEL_MONTH = 3
+LEVEL_NAMES = {LEVEL_SESSION: "session", LEVEL_DAY: "day", LEVEL_MONTH: "month"}
+KEY_LEVEL = 1; KEY_FIRST = 2; KEY_LAST = 3; KEY_START_TS = 4; KEY_END_TS = 5; KEY_COUNT = 6
+_KEY_NAMES = {KEY_LEVEL: 'level', KEY_FIRST: 'first', KEY_LAST: 'last',
+              KEY_START_TS: 'start_ts', KEY_END_TS: 'end_ts', KEY_COUNT: 'count'}
+
+Summarizer = Callable[[List[str], int], str]
+
+# ---------------------------
+# Payload codec
+# ---------------------------
+def encode_summary(level: int, first: int, last: int, start_ts: int, end_ts: int, count: int, text: str) -> bytes:
+    fields = ((KEY_LEVEL, level), (KEY_FIRST, first), (KEY_LAST, last),
+              (KEY_START_TS, start_ts), (KEY_END_TS, end_ts), (KEY_COUNT, count))
+    parts = []
+    for key, value in fields:
+        parts += [eail.op_push_key(key), eail.op_push_val(eail.AT_INT, value), eail.op_bind()]
+    parts += [eail.op_push_val(eail.AT_BYTES, text.encode('utf-8')), eail.op_end()]
+    return eail.ops(*parts)
+
+def parse_summary(payload) -> Optional[Dict]:
+    out, key = {}, None
+    for code, arg in eail_codec.decode(payload, strict=False):
+        if code == eail.OP_PUSH_KEY: key = arg
+        elif code == eail.OP_PUSH_VAL and arg.tag == eail.AT_INT and key in _KEY_NAMES: out[_KEY_NAMES[key]] = arg.value
+        elif code == eail.OP_PUSH_VAL and arg.tag == eail.AT_BYTES: out['text'] = str(arg.value, 'utf-8', 'ignore')
+        elif code == eail.OP_BIND: key = None
+    return out if 'level' in out and 'text' in out else None
+
+# ---------------------------
+# Default summarizer
+# ---------------------------
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s')
+
+def extractive_summary(texts: List[str], level: int) -> str:
+    """Offline fallback: the first sentence of every source, clipped to the level's size."""
+    limit = SUMMARY_CHARS.get(level, 800)
+    pieces = [_SENTENCE_END.split(t.strip(), 1)[0][:160] for t in texts if t and t.strip()]
+    out = "; ".join(pieces)
+    return out if len(out) <= limit else out[:limit].rstrip() + "…"
+
+def _fmt(ts: int, fmt: str) -> str:
+    return datetime.datetime.fromtimestamp(ts / 1e9).strftime(fmt)
+
+def _day_key(ts: int): return datetime.datetime.fromtimestamp(ts / 1e9).date()
+def _month_key(ts: int):
+    d = datetime.datetime.fromtimestamp(ts / 1e9)
+    return (d.year, d.month)
+
+# ---------------------------
+# Rollup stage
+# ---------------------------
+class MemRollup:
+    def __init__(self, mem: eail.CorthrexMem, summarizer: Optional[Summarizer] = None):
+        self.mem = mem
+        self.summarizer = summarizer or extractive_summary
+        self.summaries: Dict[int, List[Dict]] = {LEVEL_SESSION: [], LEVEL_DAY: [], LEVEL_MONTH: []}
+        self._pending = []            # (offset, timestamp) of turns not yet in a session summary
+        self._own = set()             # offsets of summaries this instance wrote (already cataloged)
+        self._scanned_to = eail.HEADER_SIZE
+        self._epoch = 0                    # bumped by reset(); a pass started before it publishes nothing
+        self._pass = (0, None)             # (epoch, file identity) the running pass read its sources under
+        self._lock = threading.Lock()      # the catalog above, as context_entries() reads it
+        self._run_lock = threading.Lock()  # one pass at a time; held across summarizer calls, _lock never is
+        self._stop = threading.Event()
+        self._thread = None
+
+    # --- catalog ---
+    def reset(self):
+        """After the file was rewritten: drops the catalog, the next pass rebuilds it from the start."""
+        with self._lock:
+            self.summaries = {level: [] for level in self.summaries}
+            self._pending, self._own = [], set()
+            self._scanned_to = eail.HEADER_SIZE
+            self._epoch += 1
+
+    def _stale(self) -> bool:
+        """The running pass read a file that has since been rewritten (call under _lock)."""
+        self.mem.get_tail_offset()  # notices a replaced file
+        return self._pass != (self._epoch, self.mem._file_id)
+
+    def _covered(self, level: int) -> int:
+        """Timestamp of the last source turn already rolled up at this level (0 if none)."""
+        entries = self.summaries[level]
+        return entries[-1]['end_ts'] if entries else 0
+
+    def _catch_up(self):
+        """Reads only what was appended since the last pass: new turns and summaries written elsewhere."""
+        found, scanned_to = [], self._scanned_to  # the file is read unlocked; the catalog is updated in one go
+        for rec in self.mem.scan_fast(reuse=True, start=scanned_to):
+            rtype = rec.type
+            scanned_to = rec.offset + self.mem.block_size
+            if rtype == eail.RT_SUMMARY:
+                if rec.offset in self._own:
+                    self._own.discard(rec.offset); continue
+                info = parse_summary(self.mem.reassemble_payload(rec.offset) or bytes(rec.payload))
+                if info and info['level'] in self.summaries:
+                    info['offset'] = rec.offset
+                    found.append(info)
+            elif rtype in (eail.RT_USER_REQUEST, eail.RT_AGENT_RESPONSE) and rec.agent_id != 9999:
+                found.append((rec.offset, rec.timestamp))
+        with self._lock:
+            if self._stale(): return
+            for item in found:
+                if isinstance(item, tuple): self._pending.append(item); continue
+                self.summaries[item['level']].append(item)
+                if item['level'] == LEVEL_SESSION:
+                    self._pending = [p for p in self._pending if p[1] > item['end_ts']]
+            self._scanned_to = scanned_to
+
+    def _text_of(self, offset: int) -> str:
+        rec = self.mem.get_record_at(offset)
+        text = self.mem.get_text(offset).strip()
+        if rec is None or not text: return text
+        return ("User: " if rec.type == eail.RT_USER_REQUEST else "Corthrex: ") + text
+
+    def _write(self, level: int, first: int, last: int, start_ts: int, end_ts: int, count: int, sources: List[str]) -> Optional[Dict]:
+        """Summarizes and appends one range. None if the file was rewritten meanwhile (nothing is written)."""
+        clipped, used = [], 0
+        for src in reversed(sources):  # newest sources win when the input must be clipped
+            used += len(src)
+            if used > SUMMARIZER_INPUT_CHARS and clipped: break
+            clipped.append(src)
+        clipped.reverse()
+        text = self.summarizer(clipped, level).strip() or extractive_summary(clipped, level)
+        if level == LEVEL_SESSION: label = f"Session {_fmt(start_ts, '%Y-%m-%d %H:%M')} to {_fmt(end_ts, '%H:%M')}, {count} turns"
+        elif level == LEVEL_DAY: label = f"Day {_fmt(start_ts, '%Y-%m-%d')}, {count} sessions"
+        else: label = f"Month {_fmt(start_ts, '%Y-%m')}, {count} days"
+        text = f"[{label}] {text}"
+        with self.mem.write_lock, self._lock:  # append and catalog together, so context_entries() never sees one without the other
+            if self._stale(): return None  # sources were read from the old file
+            offsets = self.mem.append_with_continuation(ROLLUP_AGENT_ID, eail.RT_SUMMARY,
+                                                        encode_summary(level, first, last, start_ts, end_ts, count, text),
+                                                        link_offset=first)
+            info = {'offset': offsets[0], 'level': level, 'first': first, 'last': last,
+                    'start_ts': start_ts, 'end_ts': end_ts, 'count': count, 'text': text}
+            self.summaries[level].append(info)
+            self._own.add(offsets[0])
+        return info
+
+    # --- levels ---
+    def _roll_sessions(self, now_ns: int) -> int:
+        sessions, current = [], []
+        for turn in self._pending:
+            if current and turn[1] - current[-1][1] > SESSION_GAP_NS:
+                sessions.append(current); current = []
+            current.append(turn)
+        if current and now_ns - current[-1][1] > SESSION_GAP_NS:
+            sessions.append(current); current = []
+
+        for n, turns in enumerate(sessions):
+            texts = [t for t in (self._text_of(off) for off, _ in turns) if t]
+            if self._write(LEVEL_SESSION, turns[0][0], turns[-1][0], turns[0][1], turns[-1][1], len(turns), texts) is None: return n
+            with self._lock: self._pending = self._pending[len(turns):]
+        return len(sessions)
+
+    def _roll_up(self, level: int, key_of, horizon_ts: Optional[int], now_ns: int) -> int:
+        """Groups uncovered summaries of level-1 by day/month and writes those groups that are closed."""
+        covered = self._covered(level)
+        children = [s for s in self.summaries[level - 1] if s['start_ts'] > covered]
+        groups = {}
+        for child in children: groups.setdefault(key_of(child['start_ts']), []).append(child)
+
+        written = 0
+        for key in sorted(groups):
+            if key >= key_of(now_ns): break
+            if horizon_ts is not None and key >= key_of(horizon_ts): break  # lower level still open for this period
+            members = groups[key]
+            if self._write(level, members[0]['first'], members[-1]['last'], members[0]['start_ts'], members[-1]['end_ts'],
+                           len(members), [m['text'] for m in members]) is None: break
+            written += 1
+        return written
+
+    def run_once(self, now_ns: Optional[int] = None) -> int:
+        """
+        One incremental pass over everything appended since the last. Returns summaries written.
+        Only passes change the catalog, so a pass reads it freely; the summarizer runs unlocked.
+        If reset() or a rewrite of the file lands mid-pass, the pass stops publishing.
+        """
+        now_ns = now_ns or time.time_ns()
+        with self._run_lock:
+            with self._lock:
+                self.mem.get_tail_offset()
+                self._pass = (self._epoch, self.mem._file_id)
+            self._catch_up()
+            written = self._roll_sessions(now_ns)
+            open_turns = self._pending[0][1] if self._pending else None
+            written += self._roll_up(LEVEL_DAY, _day_key, open_turns, now_ns)
+            open_days = [s['start_ts'] for s in self.summaries[LEVEL_SESSION] if s['start_ts'] > self._covered(LEVEL_DAY)]
+            horizon = min(open_days + ([open_turns] if open_turns else [])) if (open_days or open_turns) else None
+            written += self._roll_up(LEVEL_MONTH, _month_key, horizon, now_ns)
+        if written: logging.info(f"[Rollup] Wrote {written} summary records.")
+        return written
+
+    # --- background ---
+    def start(self, interval: float = ROLLUP_INTERVAL):
+        if self._thread and self._thread.is_alive(): return
+        self._stop.clear()
+        def loop():
+            while not self._stop.is_set():
+                try: self.run_once()
+                except Exception as e: logging.error(f"[Rollup] Pass failed: {e}")
+                self._stop.wait(interval)
+        self._thread = threading.Thread(target=loop, name="corthrex-rollup", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    # --- prompt view ---
+    def context_entries(self) -> List[Dict]:
+        """
+        The coarsest summary that covers each stretch of history, newest first:
+        months, then days not yet in a month, then sessions not yet in a day.
+        """
+        with self._lock:
+            months = list(self.summaries[LEVEL_MONTH])
+            days = [s for s in self.summaries[LEVEL_DAY] if s['start_ts'] > self._covered(LEVEL_MONTH)]
+            sessions = [s for s in self.summaries[LEVEL_SESSION] if s['start_ts'] > self._covered(LEVEL_DAY)]
+        return (months + days + sessions)[::-1]
@@ -0,0 +1,212 @@
+# simhash_index.py
+# Corthrex SimHash Recall Index
+# Multi-index hashing over the semhash16 header field: near-duplicate lookup
+# by Hamming distance without an embedding service.
+#
+# The 128-bit hash is cut into BANDS equal bands, each with its own bucket
+# table. Two hashes within distance k must agree to within k // BANDS bits on
+# at least one band (pigeonhole), so probing every band with that radius
+# finds every match. Candidates are then checked on the full 128 bits.
+#
+# Sidecar file (<memory>.simidx), append-only:
+#   header  '<4s H H 8x'  tag, version, bands
+#   entry   '<Q 16s'      head record offset, semhash16
+# It is a cache: delete it and the next sync() rebuilds it from the .cxm.
+#
+# Bucket snapshot (<memory>.simidx.bkt), rewritten by save():
+#   header  '<4s H H Q Q 16s'  tag, version, bands, entries covered, last entry
+#   per band: starts (2^band_bits + 1 x u32), then entry ids sorted by band value
+# Opening reads both files with array.frombytes and probes those arrays as
+# they are; only entries added after the snapshot go into per-band dicts.
+
+import os
+import sys
+import struct
+import itertools
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+import eail
+
+# --- Configuration ---
+INDEX_SUFFIX = '.simidx'
+INDEX_TAG = b'CXSH'
+BANDS = 8                 # 8 x 16-bit bands
+DEFAULT_RADIUS = 14       # probes each band at radius 1: exact up to distance 15
+
+SNAPSHOT_SUFFIX = '.bkt'
+SNAPSHOT_TAG = b'CXSB'
+SNAPSHOT_MIN = 100_000    # entries inserted one by one on open before a fresh snapshot is written
+
+INDEX_HEADER = struct.Struct('<4s H H 8x')
+ENTRY_STRUCT = struct.Struct('<Q 16s')
+SNAPSHOT_HEADER = struct.Struct('<4s H H Q Q 16s')
+_BIG_ENDIAN = sys.byteorder != 'little'
+
+try:
+    _popcount = int.bit_count
+except AttributeError:  # Python < 3.10
+    _popcount = lambda x: bin(x).count('1')
+
+def hamming(a: bytes, b: bytes) -> int:
+    return _popcount(int.from_bytes(a, 'little') ^ int.from_bytes(b, 'little'))
+
+class SimHashIndex:
+    def __init__(self, mem: eail.CorthrexMem, path: Optional[str] = None, bands: int = BANDS):
+        if 128 % bands: raise ValueError(f'bands must divide 128, got {bands}')
+        self.mem = mem
+        self.path = path or mem.path + INDEX_SUFFIX
+        self.bands = bands
+        self.band_bits = 128 // bands
+        self._offsets = array('Q')        # entry -> record offset
+        self._hashes = bytearray()        # entry -> 16 bytes, packed
+        self._buckets: List[Dict[int, array]] = [{} for _ in range(bands)]  # band value -> entries
+        self._snapshot: List[Tuple[array, array]] = []  # per band (starts, order): buckets loaded from .bkt
+        self._load()
+
+    def __len__(self): return len(self._offsets)
+
+    # ---------------------------
+    # Persistence
+    # ---------------------------
+    def _reset(self):
+        self._offsets = array('Q'); self._hashes = bytearray()
+        self._buckets = [{} for _ in range(self.bands)]; self._snapshot = []
+        with open(self.path, 'wb') as f: f.write(INDEX_HEADER.pack(INDEX_TAG, 1, self.bands))
+        if os.path.exists(self.path + SNAPSHOT_SUFFIX): os.remove(self.path + SNAPSHOT_SUFFIX)
+
+    def _load(self):
+        if not os.path.exists(self.path): return self._reset()
+        with open(self.path, 'rb') as f: raw = f.read()
+        if len(raw) < INDEX_HEADER.size: return self._reset()
+        tag, _, bands = INDEX_HEADER.unpack_from(raw, 0)
+        if tag != INDEX_TAG or bands != self.bands: return self._reset()
+        count = (len(raw) - INDEX_HEADER.size) // ENTRY_STRUCT.size  # a torn last entry is dropped
+        # Entries are three u64 words (offset, hash low, hash high): split the columns with strided slices
+        words = array('Q'); words.frombytes(memoryview(raw)[INDEX_HEADER.size:INDEX_HEADER.size + count * ENTRY_STRUCT.size])
+        self._offsets = words[0::3]
+        if _BIG_ENDIAN: self._offsets.byteswap()
+        hashes = array('Q', bytes(16 * count))
+        hashes[0::2], hashes[1::2] = words[1::3], words[2::3]  # raw bytes moved as-is
+        self._hashes = bytearray(hashes.tobytes())
+        del words, hashes
+
+        # A compaction rewrites offsets; the newest entry is enough to notice
+        if self._offsets and not self._entry_matches(len(self._offsets) - 1):
+            eail.logger.info(f"SimHash index {self.path} is stale, rebuilding")
+            return self._reset()
+        covered = self._load_snapshot()
+        for idx in range(covered, count): self._bucket(idx)
+        if count - covered >= SNAPSHOT_MIN: self.save()
+
+    def _load_snapshot(self) -> int:
+        """Loads the bucket arrays for the entries the snapshot covers. Returns how many (0 if it is missing or stale)."""
+        try:
+            with open(self.path + SNAPSHOT_SUFFIX, 'rb') as f: raw = f.read()
+        except OSError: return 0
+        if len(raw) < SNAPSHOT_HEADER.size: return 0
+        tag, _, bands, count, last_offset, last_hash = SNAPSHOT_HEADER.unpack_from(raw, 0)
+        keys = 1 << self.band_bits
+        if (tag != SNAPSHOT_TAG or bands != self.bands or self.band_bits > 16 or not 0 < count <= len(self._offsets)
+                or len(raw) != SNAPSHOT_HEADER.size + bands * 4 * (keys + 1 + count)
+                or self._offsets[count - 1] != last_offset or self._hashes[(count - 1) * 16:count * 16] != last_hash): return 0
+        view, pos = memoryview(raw), SNAPSHOT_HEADER.size
+        for _ in range(bands):
+            starts, order = array('I'), array('I')
+            starts.frombytes(view[pos:pos + 4 * (keys + 1)]); pos += 4 * (keys + 1)
+            order.frombytes(view[pos:pos + 4 * count]); pos += 4 * count
+            if _BIG_ENDIAN: starts.byteswap(); order.byteswap()
+            self._snapshot.append((starts, order))
+        return count
+
+    def save(self):
+        """Snapshots the bucket tables so the next open loads them in bulk. Bands wider than 16 bits are not snapshotted."""
+        count = len(self._offsets)
+        if not count or self.band_bits > 16: return
+        keys = 1 << self.band_bits
+        parts = [SNAPSHOT_HEADER.pack(SNAPSHOT_TAG, 1, self.bands, count, self._offsets[-1], bytes(self._hashes[-16:]))]
+        for b in range(self.bands):
+            starts, order = array('I', [0]), array('I')
+            for v in range(keys):
+                order.extend(self._members(b, v)); starts.append(len(order))
+            if _BIG_ENDIAN: starts.byteswap(); order.byteswap()
+            parts += [starts.tobytes(), order.tobytes()]
+        with open(self.path + SNAPSHOT_SUFFIX + '.tmp', 'wb') as f: f.write(b''.join(parts))
+        os.replace(self.path + SNAPSHOT_SUFFIX + '.tmp', self.path + SNAPSHOT_SUFFIX)
+
+    def _entry_matches(self, i: int) -> bool:
+        rec = self.mem.get_record_at(self._offsets[i])
+        return rec is not None and rec.semhash16 == bytes(self._hashes[i * 16:i * 16 + 16])
+
+    def _bands_of(self, h: int):
+        mask = (1 << self.band_bits) - 1
+        return [(h >> (b * self.band_bits)) & mask for b in range(self.bands)]
+
+    def _insert(self, offset: int, semhash: bytes):
+        self._offsets.append(offset); self._hashes += semhash
+        self._bucket(len(self._offsets) - 1)
+
+    def _members(self, band: int, value: int):
+        """Entries whose band `band` equals value: the snapshot's first, then the ones added since."""
+        tail = self._buckets[band].get(value, ())
+        if not self._snapshot: return tail
+        starts, order = self._snapshot[band]
+        lo, hi = starts[value], starts[value + 1]
+        if lo == hi: return tail
+        return itertools.chain(order[lo:hi], tail) if tail else order[lo:hi]
+
+    def _bucket(self, idx: int):
+        for b, value in enumerate(self._bands_of(int.from_bytes(self._hashes[idx * 16:idx * 16 + 16], 'little'))):
+            bucket = self._buckets[b].get(value)
+            if bucket is None: bucket = self._buckets[b][value] = array('I')
+            bucket.append(idx)
+
+    def sync(self) -> int:
+        """Indexes every committed head record written since the last sync. Returns the count added."""
+        start = self._offsets[-1] + self.mem.block_size if self._offsets else eail.HEADER_SIZE
+        return self.add((rec.offset, rec.semhash16) for rec in self.mem.scan_fast(reuse=True, start=start)
+                        if rec.type != eail.RT_CONTINUATION)
+
+    def add(self, entries) -> int:
+        """
+        Indexes (offset, semhash16) pairs of head records a writer already has
+        in hand (bulk ingest). They must follow the last indexed offset.
+        """
+        batch = []
+        for offset, semhash in entries:
+            self._insert(offset, semhash)
+            batch.append(ENTRY_STRUCT.pack(offset, semhash))
+        if batch:
+            with open(self.path, 'ab') as f: f.write(b''.join(batch))
+        return len(batch)
+
+    # ---------------------------
+    # Lookup
+    # ---------------------------
+    def _probe_values(self, value: int, radius: int):
+        yield value
+        for r in range(1, radius + 1):
+            for bits in itertools.combinations(range(self.band_bits), r):
+                flipped = value
+                for bit in bits: flipped ^= 1 << bit
+                yield flipped
+
+    def lookup(self, semhash: bytes, k: int = DEFAULT_RADIUS) -> List[Tuple[int, int]]:
+        """All indexed records within Hamming distance k, as (offset, distance), closest then newest first."""
+        q = int.from_bytes(semhash, 'little')
+        radius = k // self.bands
+        seen, hits = set(), []
+        hashes = self._hashes
+        for b, value in enumerate(self._bands_of(q)):
+            for probe in self._probe_values(value, radius):
+                for idx in self._members(b, probe):
+                    if idx in seen: continue
+                    seen.add(idx)
+                    d = _popcount(q ^ int.from_bytes(hashes[idx * 16:idx * 16 + 16], 'little'))
+                    if d <= k: hits.append((self._offsets[idx], d))
+        hits.sort(key=lambda h: (h[1], -h[0]))
+        return hits
+
+    def similar(self, text: str, k: int = DEFAULT_RADIUS, limit: Optional[int] = None) -> List[Tuple[int, int]]:
+        hits = self.lookup(eail.simhash128(text), k)
+        return hits[:limit] if limit is not None else hits
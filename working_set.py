@@ -0,0 +1,294 @@
+# working_set.py
+# Corthrex Working Set
+# What LocalAgent keeps in RAM about its own conversation.
+#
+# Every chat turn gets one row of compact metadata in typed arrays (offset,
+# type, timestamp, payload length: 21 bytes a turn, ~21 MB per million). Only
+# the newest turns are kept as decoded text, in a window bounded both by turn
+# count and bytes. Any other turn's text is read on demand from the mmap
+# through CorthrexMem.get_text (and its PayloadCache). Deep recall walks the
+# arrays instead of re-scanning every block header in the file.
+#
+# Opening is O(window): the newest turns are seeded by CorthrexMem.scan_reverse.
+# The rows for older turns are filled in by one header-only forward pass the
+# first time a walk reaches past the seeded window (backfill()).
+#
+# Doctrine (agent 9999 and RT_SYS_DIAGNOSTIC records) can sit anywhere in the
+# file, so DoctrineIndex keeps their offsets in a sidecar (<memory>.doctrine)
+# and only scans what was appended since the last run.
+#
+# max_bytes caps the whole working set. Past it the oldest rows are dropped:
+# keyword recall stops reaching that far back, SimHash recall and rollups
+# still do.
+#
+# Usage: python working_set.py [memory_file]   (prints the memory report)
+
+import os
+import sys
+import json
+import logging
+import threading
+from array import array
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import eail
+
+# --- Configuration ---
+MEMORY_FILE = "corthrex.cxm"
+TEXT_WINDOW = 100                      # newest turns kept decoded
+TEXT_WINDOW_BYTES = 1024 * 1024        # ...and at most this much text
+WORKING_SET_BYTES = 64 * 1024 * 1024   # metadata + text window ceiling
+TRIM_FRACTION = 8                      # over the ceiling: drop the oldest 1/8 of rows at once
+TEXT_OVERHEAD = 100                    # dict slot + str header, roughly
+TURN_TYPES = (eail.RT_USER_REQUEST, eail.RT_AGENT_RESPONSE)
+DOCTRINE_SUFFIX = ".doctrine"
+
+class TurnIndex:
+    """
+    Chat turns of one memory file, oldest first. Doctrine (agent 9999) is
+    excluded. sync() picks up turns appended since the last call; after the
+    file is rewritten, reset() and sync() again.
+    """
+    def __init__(self, mem: eail.CorthrexMem, types: Sequence[int] = TURN_TYPES, window: int = TEXT_WINDOW,
+                 window_bytes: int = TEXT_WINDOW_BYTES, max_bytes: int = WORKING_SET_BYTES):
+        self.mem = mem
+        self.types = tuple(types)
+        self.window, self.window_bytes, self.max_bytes = window, window_bytes, max_bytes
+        self._lock = threading.RLock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._offsets = array('q'); self._timestamps = array('q')
+            self._types = array('B'); self._lengths = array('I')
+            self._texts: Dict[int, str] = {}  # offset -> stripped text, newest turns only
+            self._text_bytes = 0
+            self._scanned_to = eail.HEADER_SIZE
+            self._seeded_from = eail.HEADER_SIZE  # turns below this offset are not indexed until backfill()
+            self._complete = False                # every turn from the start of the file is indexed
+            self.dropped = 0  # rows trimmed by the ceiling
+
+    def __len__(self): return len(self._offsets)
+
+    # ---------------------------
+    # Building
+    # ---------------------------
+    def sync(self) -> int:
+        """Indexes turns appended since the last sync (the newest window on first use). Returns how many were added."""
+        with self._lock:
+            tail = self.mem.get_tail_offset()
+            if tail < self._scanned_to: self.reset()  # file was compacted under us
+            if tail == self._scanned_to: return 0
+            if self._scanned_to == eail.HEADER_SIZE and not self._complete: return self._seed(tail)
+            cols = self._scan(self._scanned_to)
+            for arr, new in zip((self._offsets, self._timestamps, self._types, self._lengths), cols): arr.extend(new)
+            self._scanned_to = tail
+            if cols[0]: self._trim()
+            return len(cols[0])
+
+    def _seed(self, tail: int) -> int:
+        """The newest `window` turns from a backward walk, text included."""
+        seeded = []
+        for rec in self.mem.scan_reverse(filter_type=self.types):
+            if rec.offset >= tail or rec.agent_id == 9999: continue
+            seeded.append((rec.offset, rec.timestamp, rec.type, bytes(rec.payload)))
+            if len(seeded) >= max(self.window, 1): break
+        else:
+            self._complete = True  # walked back to the start of the file
+        for offset, ts, rtype, payload in reversed(seeded):
+            self._offsets.append(offset); self._timestamps.append(ts)
+            self._types.append(rtype); self._lengths.append(len(payload))
+        for offset, _, _, payload in seeded: self._put_text(offset, eail.extract_text_fast(payload).strip())
+        self._seeded_from = seeded[-1][0] if seeded else tail
+        self._scanned_to = tail
+        return len(seeded)
+
+    def backfill(self) -> int:
+        """Indexes the turns older than the seeded window. Returns how many were added."""
+        with self._lock:
+            if self._complete: return 0
+            cols = self._scan(eail.HEADER_SIZE, self._seeded_from)
+            # New arrays, not in-place inserts: a newest() walk in progress sees the swap and stops
+            self._offsets, self._timestamps = cols[0] + self._offsets, cols[1] + self._timestamps
+            self._types, self._lengths = cols[2] + self._types, cols[3] + self._lengths
+            self._complete = True
+            self._trim()
+            return len(cols[0])
+
+    def _scan(self, start: int, stop: Optional[int] = None):
+        """(offsets, timestamps, types, lengths) of the turns whose heads lie in [start, stop)."""
+        offsets, timestamps, types, lengths = array('q'), array('q'), array('B'), array('I')
+        # Headers only, CRCs unchecked (text() verifies a turn when it reads it).
+        # Chains are written contiguously: a continuation right after a turn extends its length.
+        query = self.mem.query().after(start).verify(False).where_any(
+            {'type': self.types, 'agent_not': 9999}, {'type': eail.RT_CONTINUATION})
+        for rec in query.select('offset', 'type', 'timestamp', 'link', 'payload_size'):
+            if stop is not None and rec['offset'] >= stop: break
+            if rec['type'] == eail.RT_CONTINUATION:
+                if offsets and rec['link'] == offsets[-1]: lengths[-1] += rec['payload_size'] - 2
+                continue
+            offsets.append(rec['offset']); timestamps.append(rec['timestamp'])
+            types.append(rec['type']); lengths.append(rec['payload_size'])
+        return offsets, timestamps, types, lengths
+
+    def remember(self, offset: int, text: str):
+        """Seeds the text window with a turn the caller just wrote (saves decoding it again)."""
+        with self._lock:
+            if self._offsets and offset >= self._window_start(): self._put_text(offset, text.strip())
+
+    def _window_start(self) -> int:
+        n = len(self._offsets)
+        return self._offsets[max(0, n - self.window)] if n else 0
+
+    def _put_text(self, offset: int, text: str):
+        if offset in self._texts: return
+        self._texts[offset] = text; self._text_bytes += len(text) + TEXT_OVERHEAD
+        self._trim()
+
+    def _trim(self):
+        start = self._window_start()
+        for offset in [o for o in self._texts if o < start]: self._drop_text(offset)
+        while self._texts and self._text_bytes > self.window_bytes: self._drop_text(min(self._texts))
+        dropped = 0
+        while self._metadata_bytes() + self._text_bytes > self.max_bytes and len(self._offsets) > self.window:
+            cut = max(len(self._offsets) // TRIM_FRACTION, 1)
+            # New arrays, not del arr[:cut]: a newest() walk in progress sees the swap and stops
+            self._offsets, self._timestamps = self._offsets[cut:], self._timestamps[cut:]
+            self._types, self._lengths = self._types[cut:], self._lengths[cut:]
+            dropped += cut
+        if dropped:
+            self.dropped += dropped
+            logging.warning(f"[WorkingSet] Over {self.max_bytes / 1024**2:.1f} MB: dropped the oldest {dropped:,} turns from RAM "
+                            f"(still on disk; keyword recall no longer reaches them)")
+
+    def _drop_text(self, offset: int):
+        self._text_bytes -= len(self._texts.pop(offset)) + TEXT_OVERHEAD
+
+    # ---------------------------
+    # Access
+    # ---------------------------
+    def offset(self, i: int) -> int: return self._offsets[i]
+
+    def text(self, i: int, view=None) -> str:
+        """Stripped text of turn i: from the window if decoded there, else read (and CRC-checked) from the file."""
+        offset = self._offsets[i]
+        text = self._texts.get(offset)
+        if text is None:
+            text = self._read(offset, view)
+            if i < 0: i += len(self._offsets)
+            if i >= len(self._offsets) - self.window:
+                with self._lock: self._put_text(offset, text)
+        return text
+
+    def _read(self, offset: int, view=None) -> str:
+        mem = self.mem
+        if view is None:
+            return mem.get_text(offset).strip() if mem.get_record_at(offset) is not None else ""
+        if offset + mem.block_size > len(view) or not eail._block_ok(view, offset, mem.block_size): return ""
+        return mem._text_at(offset, mem._payload_at(view, offset)).strip()
+
+    def newest(self, count: Optional[int] = None, skip: int = 0) -> Iterator[Dict[str, Any]]:
+        """
+        Turns newest first: {"type", "text", "offset", "timestamp"}, starting
+        `skip` turns back and covering `count` turns (None: back to the oldest).
+        Texts are fetched one at a time as the caller advances; empty turns are skipped.
+        """
+        if not self._complete and (count is None or len(self._offsets) - skip - count < 0): self.backfill()
+        offsets, types, timestamps = self._offsets, self._types, self._timestamps
+        hi = len(offsets) - skip
+        lo = 0 if count is None else max(0, hi - count)
+        if hi <= lo: return
+        self.mem.get_tail_offset()  # drops cached text if the file was replaced
+        mm = eail._map_file(self.mem.path)  # one mapping for the whole walk
+        view = memoryview(mm) if mm is not None else None
+        for i in range(hi - 1, lo - 1, -1):
+            if offsets is not self._offsets: return  # reset() or trim underneath: positions no longer apply
+            text = self.text(i, view)
+            if text: yield {"type": types[i], "text": text, "offset": offsets[i], "timestamp": timestamps[i]}
+
+    # ---------------------------
+    # Reporting
+    # ---------------------------
+    def _metadata_bytes(self) -> int:
+        return sum(sys.getsizeof(arr) for arr in (self._offsets, self._timestamps, self._types, self._lengths))
+
+    def memory_report(self) -> Dict[str, Any]:
+        n = len(self._offsets)
+        meta = self._metadata_bytes()
+        per_turn = sum(arr.itemsize for arr in (self._offsets, self._timestamps, self._types, self._lengths))
+        return {'turns': n, 'complete': self._complete, 'dropped': self.dropped, 'metadata_bytes': meta,
+                'window_turns': len(self._texts), 'window_bytes': self._text_bytes,
+                'resident_bytes': meta + self._text_bytes, 'max_bytes': self.max_bytes,
+                'payload_bytes_on_disk': sum(self._lengths),
+                # Metadata is what grows with history; the text window is fixed
+                'bytes_per_million': int(meta / n * 1_000_000) if n else per_turn * 1_000_000}
+
+class DoctrineIndex:
+    """
+    Offsets of the doctrine records, oldest first. The sidecar stores them with
+    the scan position and the CRC of the block just before it; a rewritten file
+    fails that check (or the offsets no longer name doctrine) and is rescanned.
+    """
+    def __init__(self, mem: eail.CorthrexMem, path: Optional[str] = None):
+        self.mem = mem
+        self.path = path or mem.path + DOCTRINE_SUFFIX
+        self.offsets: List[int] = []
+        self._scanned_to, self._crc = eail.HEADER_SIZE, 0
+        self._load()
+
+    def _crc_before(self, offset: int) -> Optional[int]:
+        if offset <= eail.HEADER_SIZE: return 0
+        with open(self.mem.path, 'rb') as f:
+            f.seek(offset - 4); data = f.read(4)
+        return eail._U32.unpack(data)[0] if len(data) == 4 else None
+
+    def _is_doctrine(self, offset: int) -> bool:
+        rec = self.mem.get_record_at(offset)
+        return rec is not None and rec.type != eail.RT_CONTINUATION and (rec.agent_id == 9999 or rec.type == eail.RT_SYS_DIAGNOSTIC)
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f: state = json.load(f)
+            scanned_to, offsets = int(state['scanned_to']), [int(o) for o in state['offsets']]
+            fresh = (scanned_to <= self.mem.get_tail_offset() and self._crc_before(scanned_to) == state['crc']
+                     and all(self._is_doctrine(o) for o in offsets))
+        except (OSError, ValueError, KeyError, TypeError): fresh = False
+        if fresh: self.offsets, self._scanned_to, self._crc = offsets, scanned_to, state['crc']
+        else: self.reset()
+
+    def reset(self):
+        self.offsets, self._scanned_to, self._crc = [], eail.HEADER_SIZE, 0
+
+    def _save(self):
+        state = {'scanned_to': self._scanned_to, 'crc': self._crc, 'offsets': self.offsets}
+        with open(self.path + '.tmp', 'w', encoding='utf-8') as f: json.dump(state, f)
+        os.replace(self.path + '.tmp', self.path)
+
+    def sync(self) -> int:
+        """Indexes doctrine appended since the last sync (everything after a rewrite). Returns how many were added."""
+        tail = self.mem.get_tail_offset()
+        if tail < self._scanned_to or self._crc_before(self._scanned_to) != self._crc: self.reset()  # rewritten underneath
+        if tail == self._scanned_to: return 0
+        query = self.mem.query().after(self._scanned_to).where_any({'agent_id': 9999}, {'type': eail.RT_SYS_DIAGNOSTIC})
+        found = [rec['offset'] for rec in query.select('offset') if rec['offset'] < tail]
+        self.offsets += found
+        self._scanned_to, self._crc = tail, self._crc_before(tail)
+        try: self._save()
+        except OSError as e: logging.warning(f"[WorkingSet] Could not save {self.path}: {e}")
+        return len(found)
+
+    def texts(self) -> List[str]:
+        """Doctrine texts in file order, continuations included."""
+        return self.mem.get_texts(self.offsets)
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else MEMORY_FILE
+    if not os.path.exists(path): print(f"[ERROR] '{path}' not found."); sys.exit(1)
+    turns = TurnIndex(eail.CorthrexMem(path))
+    turns.sync(); turns.backfill()  # the whole history, as after the agent's first deep recall
+    report = turns.memory_report()
+    print(f"[WORKING SET] {report['turns']:,} turns ({report['payload_bytes_on_disk'] / 1024**2:.1f} MB of payload on disk)")
+    print(f" - Metadata:    {report['metadata_bytes'] / 1024**2:.2f} MB ({report['bytes_per_million'] / 1024**2:.1f} MB per million turns)")
+    print(f" - Text window: {report['window_turns']} turns, {report['window_bytes'] / 1024:.1f} KB")
+    print(f" - Resident:    {report['resident_bytes'] / 1024**2:.2f} MB of {report['max_bytes'] / 1024**2:.0f} MB ceiling")